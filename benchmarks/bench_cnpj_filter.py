@@ -0,0 +1,101 @@
+# =============================================================================
+# benchmarks/bench_cnpj_filter.py — Casamento da lista de CNPJs nos filtros:
+# is_in versus semi-join hash versus sort-merge (filterer._match_keys).
+#
+# Gera Parquets sintéticos de ESTABELE (CNPJ Int64 + colunas de texto) e,
+# para cada tamanho de lista, mede o tempo de cada estratégia varrendo todos
+# os arquivos, um por vez. Metade dos CNPJs da lista existe nos arquivos; a
+# outra metade não (como numa planilha de cliente com CNPJs baixados).
+#
+# Uso:
+#   python benchmarks/bench_cnpj_filter.py --rows 8000000 --workdir /tmp/bench
+#   python benchmarks/bench_cnpj_filter.py --sizes 1000 100000 5000000
+# =============================================================================
+
+import argparse
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from filterer import _key_strategy, _match_keys  # noqa: E402
+from parquet_io import write_parquet  # noqa: E402
+
+_ESTRATEGIAS = ["is_in", "semi", "merge"]
+
+
+def _gerar_parquets(workdir: Path, rows: int, n_files: int) -> list[Path]:
+    """Cria n_files Parquets com `rows` estabelecimentos no total."""
+    print(f"[BENCH] Gerando {rows:,} estabelecimentos em {n_files} Parquet(s)...")
+    por_arquivo = -(-rows // n_files)
+    files = []
+    for i in range(n_files):
+        n = min(por_arquivo, rows - i * por_arquivo)
+        basico = (pl.int_range(n, dtype=pl.Int64) * 7 + i * por_arquivo * 7) % 100_000_000
+        df = pl.select(
+            (basico * 1_000_000 + 100 + pl.int_range(n, dtype=pl.Int64) % 100).alias("CNPJ"),
+            basico.cast(pl.Int32).alias("CNPJ_BASICO"),
+            pl.format("ESTABELECIMENTO {}", pl.int_range(n)).alias("NOME_FANTASIA"),
+            pl.lit("RUA DAS ACÁCIAS").alias("LOGRADOURO"),
+        ).sample(fraction=1.0, shuffle=True, seed=i)
+        path = workdir / f"ESTABELE{i}.parquet"
+        write_parquet(df, path)
+        files.append(path)
+    return files
+
+
+def _gerar_lista(files: list[Path], n: int) -> pl.Series:
+    """n CNPJs únicos e ordenados: metade presente nos arquivos, metade ausente."""
+    existentes = pl.scan_parquet(files).select("CNPJ").collect().to_series()
+    presentes = existentes.sample(min(n // 2, len(existentes)), seed=42)
+    ausentes = pl.int_range(n - len(presentes), dtype=pl.Int64, eager=True) * 100 + 99
+    return pl.concat([presentes, ausentes]).unique().sort().rename("CNPJ")
+
+
+def _bench(files: list[Path], cnpjs: pl.Series, strategy: str) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    query = _match_keys("CNPJ", cnpjs, strategy)
+    total = 0
+    for f in files:
+        total += len(query(pl.scan_parquet(f)).collect())
+    return time.perf_counter() - t0, total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark do casamento de listas de CNPJs: is_in, semi-join e sort-merge.",
+    )
+    parser.add_argument("--rows", type=int, default=8_000_000,
+                        help="Total de estabelecimentos sintéticos (padrão: 8000000).")
+    parser.add_argument("--files", type=int, default=4,
+                        help="Número de Parquets (padrão: 4).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 5_000_000],
+                        help="Tamanhos das listas de CNPJs (padrão: 1000 100000 5000000).")
+    parser.add_argument("--workdir", type=str, default="/tmp/bench_cnpj_filter",
+                        help="Diretório de trabalho (é apagado ao final).")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    shutil.rmtree(workdir, ignore_errors=True)
+    workdir.mkdir(parents=True)
+
+    try:
+        files = _gerar_parquets(workdir, args.rows, args.files)
+        print(f"\n{'CNPJs':>10} {'estratégia':<10} {'tempo (s)':>10} {'matches':>10} {'padrão':>7}")
+        for n in args.sizes:
+            cnpjs = _gerar_lista(files, n)
+            padrao = _key_strategy(len(cnpjs))
+            for strategy in _ESTRATEGIAS:
+                elapsed, total = _bench(files, cnpjs, strategy)
+                marca = "*" if strategy == padrao else ""
+                print(f"{n:>10,} {strategy:<10} {elapsed:>10.2f} {total:>10,} {marca:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# =============================================================================
+# benchmarks/bench_latin1.py — latin1 → utf8: iconv (caminho antigo) versus
+# transcodificação em blocos dentro do processo (downloader._latin1_to_utf8).
+#
+# Gera um CSV sintético no formato da RFB (latin1, campos entre aspas, com
+# acentos), compacta em ZIP e mede, para cada caminho, o tempo total e
+# quantos bytes foram gravados em disco:
+#   iconv   — extrai o CSV do ZIP + iconv para um segundo arquivo utf8
+#   disk    — _latin1_to_utf8: ZIP → CSV utf8 em uma única gravação
+#   stream  — _iter_utf8_chunks: ZIP → blocos utf8 em memória (nada gravado)
+#
+# Uso:
+#   python benchmarks/bench_latin1.py --size-mb 1024 --workdir /tmp/bench
+# =============================================================================
+
+import argparse
+import random
+import shutil
+import subprocess
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from downloader import _STREAM_CHUNK_BYTES, _iter_utf8_chunks, _latin1_to_utf8  # noqa: E402
+
+_NOMES = ["PADARIA SÃO JOSÉ", "AÇOUGUE CORAÇÃO", "FARMÁCIA POPULAR", "OFICINA DO JOÃO"]
+
+
+def _gerar_zip(workdir: Path, size_mb: int) -> Path:
+    """Cria ESTABELE.zip com um CSV latin1 sintético de ~size_mb MB."""
+    zip_path = workdir / "K3241.K03200Y0.D51213.ESTABELE.zip"
+    alvo = size_mb * 1024 * 1024
+    rnd = random.Random(42)
+    linhas = [
+        ";".join(f'"{v}"' for v in [
+            f"{rnd.randint(0, 99_999_999):08d}", "0001", f"{rnd.randint(0, 99):02d}", "1",
+            rnd.choice(_NOMES), "02", "20200101", "00", "", "", "20100315", "4711302",
+            "4712100,5611201", "RUA", "DAS ACÁCIAS", str(rnd.randint(1, 3000)), "",
+            "CENTRO", f"{rnd.randint(1_000_000, 99_999_999):08d}", "MS", "9051",
+            "67", "33334444", "", "", "", "", "", "", "",
+        ]) + "\n"
+        for _ in range(10_000)
+    ]
+    bloco = "".join(linhas).encode("latin1")
+
+    print(f"[BENCH] Gerando CSV sintético de {size_mb} MB em {zip_path.name}...")
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+        with z.open("K3241.K03200Y0.D51213.ESTABELECSV", "w", force_zip64=True) as f:
+            escrito = 0
+            while escrito < alvo:
+                f.write(bloco)
+                escrito += len(bloco)
+    return zip_path
+
+
+def _bench_iconv(zip_path: Path, workdir: Path) -> tuple[float, int]:
+    out = workdir / "iconv"
+    out.mkdir()
+    t0 = time.perf_counter()
+    with zipfile.ZipFile(zip_path) as z:
+        member = z.namelist()[0]
+        z.extractall(out)
+    src = out / member
+    gravado = src.stat().st_size
+    dst = out / "utf8.csv"
+    subprocess.run(
+        ["iconv", "-f", "latin1", "-t", "utf-8", str(src), "-o", str(dst)],
+        check=True,
+    )
+    src.unlink()
+    elapsed = time.perf_counter() - t0
+    gravado += dst.stat().st_size
+    return elapsed, gravado
+
+
+def _bench_disk(zip_path: Path, workdir: Path) -> tuple[float, int]:
+    out = workdir / "disk"
+    out.mkdir()
+    with zipfile.ZipFile(zip_path) as z:
+        member = z.namelist()[0]
+    dst = out / "utf8.csv"
+    t0 = time.perf_counter()
+    _latin1_to_utf8(zip_path, member, dst)
+    return time.perf_counter() - t0, dst.stat().st_size
+
+
+def _bench_stream(zip_path: Path, workdir: Path) -> tuple[float, int]:
+    with zipfile.ZipFile(zip_path) as z:
+        member = z.namelist()[0]
+    t0 = time.perf_counter()
+    for _ in _iter_utf8_chunks(zip_path, member, _STREAM_CHUNK_BYTES):
+        pass
+    return time.perf_counter() - t0, 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark latin1 → utf8: iconv versus transcodificação em blocos.",
+    )
+    parser.add_argument("--size-mb", type=int, default=1024,
+                        help="Tamanho do CSV sintético em MB (padrão: 1024).")
+    parser.add_argument("--workdir", type=str, default="/tmp/bench_latin1",
+                        help="Diretório de trabalho (é apagado ao final).")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    shutil.rmtree(workdir, ignore_errors=True)
+    workdir.mkdir(parents=True)
+
+    try:
+        zip_path = _gerar_zip(workdir, args.size_mb)
+        casos = {"disk": _bench_disk, "stream": _bench_stream}
+        if shutil.which("iconv"):
+            casos = {"iconv": _bench_iconv, **casos}
+        else:
+            print("[BENCH] iconv não encontrado — caso 'iconv' ignorado.")
+
+        print(f"\n{'caminho':<8} {'tempo (s)':>10} {'MB/s':>8} {'gravado (MB)':>13}")
+        for nome, fn in casos.items():
+            elapsed, gravado = fn(zip_path, workdir)
+            mb_s = args.size_mb / elapsed
+            print(f"{nome:<8} {elapsed:>10.2f} {mb_s:>8.0f} {gravado / 2**20:>13.0f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# =============================================================================
+# bloom.py — Filtros de Bloom sobre CNPJ_BASICO gravados ao lado de cada
+#            Parquet de ESTABELE e EMPRE ({parquet}.bloom).
+#
+# Os filtros por CNPJ consultam o Bloom de cada arquivo antes de abri-lo:
+# se nenhum CNPJ_BASICO pedido pode estar no arquivo, ele é pulado. Falsos
+# positivos só fazem um arquivo ser lido à toa; um arquivo sem .bloom é
+# sempre lido.
+#
+# Formato: cabeçalho struct "<8sIQ" (MAGIC, k, m) seguido de m bits.
+# As k posições de uma chave x são ((a_i * x + b_i) mod P) mod m, com
+# P = 2^31 - 1 e (a_i, b_i) fixos — calculadas vetorizadas no Polars.
+# Como CNPJ_BASICO < 10^8 < 2^27, a_i * x cabe em Int64.
+# =============================================================================
+
+import random
+import struct
+from pathlib import Path
+
+import polars as pl
+
+from config import BLOOM_BITS_PER_KEY, BLOOM_HASHES
+
+MAGIC = b"RFBBLM1\0"
+_HEADER = struct.Struct("<8sIQ")
+_PRIME = 2**31 - 1
+
+# Coeficientes fixos das funções de hash (mudar exige trocar MAGIC)
+_rng = random.Random(20251213)
+_COEFS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(32)]
+
+
+def bloom_path(parquet_path: Path) -> Path:
+    return parquet_path.with_name(f"{parquet_path.name}.bloom")
+
+
+def _positions(keys: pl.Series, k: int, m: int) -> pl.DataFrame:
+    """Posições dos bits de cada chave: colunas KEY, POS (k linhas por chave)."""
+    x = pl.col("KEY").cast(pl.Int64)
+    return keys.rename("KEY").to_frame().select(
+        pl.col("KEY"),
+        pl.concat_list([((a * x + b) % _PRIME) % m for a, b in _COEFS[:k]]).alias("POS"),
+    ).explode("POS")
+
+
+def write_bloom(parquet_path: Path, column: str = "CNPJ_BASICO") -> Path:
+    """Constrói e grava o Bloom de `column` do Parquet. Retorna o caminho."""
+    keys = (
+        pl.scan_parquet(parquet_path, hive_partitioning=False)
+        .select(pl.col(column).drop_nulls().unique())
+        .collect()
+        .to_series()
+    )
+    k = BLOOM_HASHES
+    m = max(64, -(-len(keys) * BLOOM_BITS_PER_KEY // 8) * 8)
+
+    # Bits agrupados por byte com OR; bytes sem nenhum bit ficam em zero
+    by_byte = (
+        _positions(keys, k, m)
+        .select(
+            (pl.col("POS") // 8).alias("BYTE"),
+            pl.lit(2).pow(pl.col("POS") % 8).cast(pl.UInt8).alias("BIT"),
+        )
+        .group_by("BYTE")
+        .agg(pl.col("BIT").bitwise_or())
+    )
+    bits = (
+        pl.int_range(m // 8, dtype=pl.Int64, eager=True).alias("BYTE").to_frame()
+        .join(by_byte, on="BYTE", how="left", maintain_order="left")
+        .get_column("BIT")
+        .fill_null(0)
+        .to_list()
+    )
+
+    path = bloom_path(parquet_path)
+    path.write_bytes(_HEADER.pack(MAGIC, k, m) + bytes(bits))
+    return path
+
+
+def might_contain(parquet_path: Path, keys: pl.Series) -> bool:
+    """
+    False só se nenhuma das chaves pode estar no Parquet. Sem .bloom (ou
+    com formato desconhecido), responde True.
+    """
+    path = bloom_path(parquet_path)
+    if not path.exists():
+        return True
+    data = path.read_bytes()
+    magic, k, m = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        return True
+    bits = memoryview(data)[_HEADER.size:]
+
+    pos = _positions(keys, k, m)
+    for key_pos in pos.group_by("KEY").agg("POS")["POS"].to_list():
+        if all(bits[p >> 3] >> (p & 7) & 1 for p in key_pos):
+            return True
+    return False
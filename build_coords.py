@@ -0,0 +1,104 @@
+# =============================================================================
+# build_coords.py — Pré-compila os arquivos coord_{UF}.parquet num store
+#                   padronizado, lido direto pelo enriquecimento.
+#
+# Para cada UF, aplica uma única vez a padronização de enricher
+# (normalize_coords: CEP e número inteiros, lat/lon Float32, sem pontos
+# incompletos nem duplicados) e grava, ao lado do original:
+#   coord_{UF}.store/COD_MUNICIPIO=<ibge>/00000000.parquet
+#   coord_{UF}.store/meta.json   — versão do formato + tamanho e rodapé da origem
+# Cada município fica ordenado por CEP + número, pronto para os merges.
+#
+# Uso:
+#   python build_coords.py --coords-dir /tmp/rfb_data/coords
+#   python build_coords.py --coords-dir /tmp/rfb_data/coords --uf MS SP --force
+# =============================================================================
+
+import argparse
+import json
+import re
+import shutil
+import sys
+from pathlib import Path
+
+import polars as pl
+
+from enricher import (
+    coords_store_dir,
+    coords_store_is_current,
+    coords_store_meta,
+    normalize_coords,
+    scan_raw_coords,
+)
+from parquet_io import sink_parquet
+
+
+def build_coords(uf: str, coords_dir: Path) -> Path:
+    """
+    Grava o store padronizado de uma UF, substituindo um store anterior.
+    Retorna o diretório do store.
+    """
+    store = coords_store_dir(uf, coords_dir)
+    tmp_dir = store.with_name(f"{store.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"[COOR] Padronizando coord_{uf.upper()}.parquet...")
+    sink_parquet(
+        normalize_coords(scan_raw_coords(uf, coords_dir))
+        .sort(["COD_MUNICIPIO", "CEP", "NUM_ENDERECO"]),
+        pl.PartitionBy(
+            tmp_dir, key="COD_MUNICIPIO", include_key=True,
+            approximate_bytes_per_file=None,
+        ),
+    )
+    # Sem nenhum ponto válido o PartitionBy não cria o diretório; o store
+    # vazio ainda é gravado, para não padronizar a UF a cada execução
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    (tmp_dir / "meta.json").write_text(json.dumps(coords_store_meta(uf, coords_dir), indent=1))
+
+    shutil.rmtree(store, ignore_errors=True)
+    tmp_dir.replace(store)
+
+    files = sorted(store.glob("COD_MUNICIPIO=*/*.parquet"))
+    linhas = pl.scan_parquet(files).select(pl.len()).collect().item() if files else 0
+    municipios = len({f.parent for f in files})
+    print(f"[COOR] {store.name}: {linhas:,} pontos em {municipios:,} município(s)")
+    return store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Pré-compila coord_{UF}.parquet em stores padronizados por município.",
+    )
+    parser.add_argument(
+        "--coords-dir", required=True,
+        help="Diretório com os arquivos coord_{UF}.parquet; os stores são gravados nele.",
+    )
+    parser.add_argument(
+        "--uf", nargs="+", default=None,
+        help="UFs a compilar (padrão: todas as que têm coord_{UF}.parquet).",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Recompila mesmo os stores que estão atualizados.",
+    )
+    args = parser.parse_args()
+
+    coords_dir = Path(args.coords_dir)
+    ufs = args.uf or sorted(
+        m.group(1) for f in coords_dir.glob("coord_*.parquet")
+        if (m := re.fullmatch(r"coord_(\w+)\.parquet", f.name))
+    )
+    if not ufs:
+        print(f"[ERROR] Nenhum coord_{{UF}}.parquet em {coords_dir}")
+        sys.exit(1)
+
+    for uf in ufs:
+        if not args.force and coords_store_is_current(uf, coords_dir):
+            print(f"[SKIP] coord_{uf.upper()}.store — já atualizado.")
+            continue
+        build_coords(uf, coords_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# =============================================================================
+# cnpj_index.py — Índice persistente CNPJ → (arquivo, linha) dos Parquets de
+#                 ESTABELE, para buscas pontuais sem varrer o mês inteiro.
+#
+# Fica em {base_dir}/{mês}/parquet/ESTABELE.cnpjidx/ e é construído uma vez
+# por mês, depois da ingestão (--cnpj-index):
+#   keys.i64   — chaves CNPJ (Int64) ordenadas
+#   files.u32  — índice do Parquet de cada chave em meta.json["files"]
+#   rows.u32   — linha da chave dentro desse Parquet
+#   meta.json  — Parquets indexados (caminho relativo + tamanho), contagem
+#                e linhas de cada row group de cada Parquet
+#
+# Os três arrays são binários crus (ordem de bytes da máquina), abertos via
+# mmap: uma busca faz bisect direto no arquivo e só as páginas tocadas são
+# lidas do disco. Com (arquivo, linha), a leitura usa um slice() do Polars
+# por row group com linhas pedidas, nos limites gravados no meta.json (o
+# layout real de cada arquivo, qualquer que seja o row_group_size com que
+# foi gravado): cada row group é descomprimido no máximo uma vez.
+#
+# O índice é invalidado quando a lista de Parquets ou o tamanho de algum
+# deles muda (reconversão, outro layout, novo schema).
+# =============================================================================
+
+import bisect
+import itertools
+import json
+import mmap
+import shutil
+import sys
+from array import array
+from pathlib import Path
+
+import polars as pl
+
+from config import SCHEMA_VERSION
+from parquet_io import row_group_sizes
+
+INDEX_VERSION = 2
+
+# Linhas convertidas por vez ao gravar os arrays (limita a RAM do to_list)
+_WRITE_CHUNK_ROWS = 1_000_000
+
+
+def _describe(files: list[Path], root: Path) -> list[dict]:
+    return [
+        {"path": f.relative_to(root).as_posix(), "size": f.stat().st_size}
+        for f in files
+    ]
+
+
+def is_current(index_dir: Path, files: list[Path], root: Path) -> bool:
+    """True se o índice existe e foi construído a partir exatamente destes Parquets."""
+    meta_path = index_dir / "meta.json"
+    if not meta_path.exists():
+        return False
+    meta = json.loads(meta_path.read_text())
+    return (
+        meta.get("version") == INDEX_VERSION
+        and meta.get("schema") == SCHEMA_VERSION
+        and meta.get("byteorder") == sys.byteorder
+        and meta.get("files") == _describe(files, root)
+    )
+
+
+def build_cnpj_index(files: list[Path], index_dir: Path, root: Path) -> int:
+    """
+    Constrói o índice dos Parquets `files` (caminhos gravados relativos a
+    root) em index_dir, substituindo um índice anterior. A ordenação das
+    chaves passa pela memória: ~16 bytes por estabelecimento.
+
+    Retorna o número de chaves indexadas.
+    """
+    print(f"[INDX] Construindo índice de CNPJ de {len(files)} arquivo(s)...")
+    df = (
+        pl.concat([
+            pl.scan_parquet(f, hive_partitioning=False)
+            .select(
+                pl.col("CNPJ"),
+                pl.lit(i, dtype=pl.UInt32).alias("FILE"),
+                pl.int_range(pl.len(), dtype=pl.UInt32).alias("ROW"),
+            )
+            for i, f in enumerate(files)
+        ])
+        .drop_nulls("CNPJ")
+        .sort("CNPJ")
+        .collect()
+    )
+
+    tmp_dir = index_dir.with_name(f"{index_dir.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    with (
+        open(tmp_dir / "keys.i64", "wb") as fk,
+        open(tmp_dir / "files.u32", "wb") as ff,
+        open(tmp_dir / "rows.u32", "wb") as fr,
+    ):
+        for offset in range(0, len(df), _WRITE_CHUNK_ROWS):
+            chunk = df.slice(offset, _WRITE_CHUNK_ROWS)
+            array("q", chunk["CNPJ"].to_list()).tofile(fk)
+            array("I", chunk["FILE"].to_list()).tofile(ff)
+            array("I", chunk["ROW"].to_list()).tofile(fr)
+
+    (tmp_dir / "meta.json").write_text(json.dumps({
+        "version": INDEX_VERSION,
+        "schema": SCHEMA_VERSION,
+        "byteorder": sys.byteorder,
+        "count": len(df),
+        "files": _describe(files, root),
+        "row_groups": [row_group_sizes(f) for f in files],
+    }, indent=1))
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    tmp_dir.replace(index_dir)
+    print(f"[INDX] {len(df):,} CNPJs indexados em {index_dir.name}")
+    return len(df)
+
+
+class CnpjIndex:
+    """Índice aberto via mmap. Usar como context manager."""
+
+    def __init__(self, index_dir: Path, root: Path):
+        meta = json.loads((index_dir / "meta.json").read_text())
+        self.count = meta["count"]
+        self.files = [root / f["path"] for f in meta["files"]]
+        self.row_groups = dict(zip(self.files, meta["row_groups"]))
+        self._maps: list[mmap.mmap] = []
+        self._views: list[memoryview] = []
+        if self.count:
+            self._keys  = self._open(index_dir / "keys.i64", "q")
+            self._fids  = self._open(index_dir / "files.u32", "I")
+            self._rows  = self._open(index_dir / "rows.u32", "I")
+
+    def _open(self, path: Path, fmt: str) -> memoryview:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm).cast(fmt)
+        self._maps.append(mm)
+        self._views.append(view)
+        return view
+
+    def lookup(self, cnpjs: pl.Series) -> dict[Path, list[int]]:
+        """
+        Localiza as chaves CNPJ (Int64) no índice por busca binária.
+        Retorna {parquet: [linhas]} só com os CNPJs encontrados.
+        """
+        found: dict[Path, list[int]] = {}
+        if not self.count:
+            return found
+        for cnpj in cnpjs.to_list():
+            pos = bisect.bisect_left(self._keys, cnpj)
+            if pos < self.count and self._keys[pos] == cnpj:
+                found.setdefault(self.files[self._fids[pos]], []).append(self._rows[pos])
+        return found
+
+    def close(self) -> None:
+        for view in self._views:
+            view.release()
+        for mm in self._maps:
+            mm.close()
+
+    def __enter__(self) -> "CnpjIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_rows(path: Path, rows: list[int], row_groups: list[int]) -> pl.DataFrame:
+    """
+    Lê as linhas `rows` de um Parquet cujos row groups têm `row_groups`
+    linhas (CnpjIndex.row_groups). As linhas de um mesmo row group são
+    lidas num único slice(), que nunca passa dos limites dele; só um slice
+    fica em memória por vez.
+    """
+    starts = list(itertools.accumulate(row_groups, initial=0))
+    rows = sorted(rows)
+    partes: list[pl.DataFrame] = []
+    start = 0
+    for i in range(1, len(rows) + 1):
+        if i == len(rows) or (
+            bisect.bisect_right(starts, rows[i]) != bisect.bisect_right(starts, rows[start])
+        ):
+            first, last = rows[start], rows[i - 1]
+            wanted = pl.Series([r - first for r in rows[start:i]], dtype=pl.UInt32)
+            partes.append(
+                pl.scan_parquet(path, hive_partitioning=False)
+                .slice(first, last - first + 1)
+                .collect()
+                .select(pl.all().gather(wanted))
+            )
+            start = i
+    return pl.concat(partes, how="vertical")
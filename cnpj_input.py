@@ -0,0 +1,186 @@
+# =============================================================================
+# cnpj_input.py — Leitura das listas de CNPJs enviadas pelos clientes
+#                 (--cnpjs-file) em XLSX, CSV, Parquet ou TXT.
+#
+# O formato é escolhido pela extensão (CNPJ_READERS). Cada leitor devolve
+# um LazyFrame com uma única coluna RAW (a primeira coluna do arquivo, ou a
+# coluna CNPJ de um Parquet); a normalização é a mesma para todos e roda
+# vetorizada no Polars:
+#   1. remove pontuação ("12.345.678/0001-95" → "12345678000195") e o ".0"
+#      de células numéricas lidas como texto
+#   2. repõe zeros à esquerda perdidos em células numéricas (12–13 dígitos)
+#   3. descarta o que não tem 14 dígitos (cabeçalho, CPFs, lixo)
+#   4. confere os dois dígitos verificadores (módulo 11)
+#   5. remove duplicados
+# O resultado é a chave Int64 "CNPJ" dos Parquets (ver config.py), ordenada,
+# pronta para filter_cnpj_estab / filter_cnpj_empresa.
+#
+# XLSX é lido pelo motor calamine do Polars (pacote fastexcel), colunar e
+# muito mais rápido que o openpyxl, que continua como alternativa se o
+# fastexcel não estiver instalado.
+# =============================================================================
+
+from collections.abc import Callable
+from pathlib import Path
+
+import polars as pl
+
+# Pesos dos dígitos verificadores do CNPJ (módulo 11)
+_PESOS_DV1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+_PESOS_DV2 = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+
+# Separadores testados na primeira linha de um CSV
+_CSV_SEPARATORS = [";", ",", "\t", "|"]
+
+
+# ---------------------------------------------------------------------------
+# Leitores por formato
+# ---------------------------------------------------------------------------
+
+def _read_xlsx(path: Path) -> pl.LazyFrame:
+    """Primeira coluna da planilha ativa, como texto."""
+    try:
+        df = pl.read_excel(
+            path, engine="calamine", has_header=False, columns=[0],
+            infer_schema_length=0,
+        )
+        return df.select(pl.first().alias("RAW")).lazy()
+    except ImportError:
+        print("[WARN] fastexcel não instalado; lendo o XLSX com openpyxl (mais lento).")
+
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    ws = wb.active
+    valores = [
+        # Células numéricas: 12345678000195.0 → "12345678000195"
+        str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
+        for (v,) in ws.iter_rows(max_col=1, values_only=True)
+        if v is not None
+    ]
+    wb.close()
+    return pl.LazyFrame({"RAW": valores}, schema={"RAW": pl.Utf8})
+
+
+def _sniff_separator(path: Path) -> str | None:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        linha = f.readline()
+    contagens = {sep: linha.count(sep) for sep in _CSV_SEPARATORS}
+    sep = max(contagens, key=contagens.get)
+    return sep if contagens[sep] else None
+
+
+def _read_csv(path: Path) -> pl.LazyFrame:
+    """Primeira coluna do CSV (separador detectado na primeira linha)."""
+    sep = _sniff_separator(path)
+    if sep is None:
+        return _read_txt(path)
+    return pl.scan_csv(
+        path, has_header=False, separator=sep, infer_schema=False,
+        encoding="utf8-lossy", truncate_ragged_lines=True,
+    ).select(pl.first().alias("RAW"))
+
+
+def _read_txt(path: Path) -> pl.LazyFrame:
+    """Um CNPJ por linha."""
+    return pl.scan_lines(path, name="RAW")
+
+
+def _read_parquet(path: Path) -> pl.LazyFrame:
+    """Coluna CNPJ, se existir; senão a primeira coluna."""
+    lf = pl.scan_parquet(path)
+    schema = lf.collect_schema()
+    coluna = "CNPJ" if "CNPJ" in schema else schema.names()[0]
+    return lf.select(pl.col(coluna).alias("RAW"))
+
+
+CNPJ_READERS: dict[str, Callable[[Path], pl.LazyFrame]] = {
+    ".xlsx":    _read_xlsx,
+    ".xlsm":    _read_xlsx,
+    ".csv":     _read_csv,
+    ".parquet": _read_parquet,
+    ".txt":     _read_txt,
+}
+
+
+# ---------------------------------------------------------------------------
+# Normalização e validação
+# ---------------------------------------------------------------------------
+
+def _dv(pesos: list[int]) -> pl.Expr:
+    """Dígito verificador calculado das colunas D0.. com os pesos dados."""
+    resto = pl.sum_horizontal(p * pl.col(f"D{i}") for i, p in enumerate(pesos)) % 11
+    return pl.when(resto < 2).then(0).otherwise(11 - resto)
+
+
+def dv_ok(keys: pl.Series) -> pl.Series:
+    """True para cada chave CNPJ (Int64) cujos dígitos verificadores conferem."""
+    # Cada dígito é extraído uma vez, em colunas D0..D13
+    return (
+        keys.to_frame("CNPJ").lazy()
+        .select(
+            (pl.col("CNPJ") // 10 ** (13 - i) % 10).cast(pl.Int32).alias(f"D{i}")
+            for i in range(14)
+        )
+        .select((_dv(_PESOS_DV1) == pl.col("D12")) & (_dv(_PESOS_DV2) == pl.col("D13")))
+        .collect()
+        .to_series()
+    )
+
+
+def _to_key(raw: pl.Expr, dtype: pl.DataType) -> pl.Expr:
+    """Valor lido → chave Int64 de 14 dígitos, ou null se não for um CNPJ."""
+    if dtype.is_integer():
+        key = raw.cast(pl.Int64)
+    else:
+        digits = (
+            raw.cast(pl.Utf8)
+            .str.strip_chars()
+            .str.replace(r"\.0+$", "")
+            .str.replace_all(r"\D", "")
+        )
+        n = digits.str.len_bytes()
+        key = (
+            pl.when(n.is_between(12, 14))
+            .then(digits.str.zfill(14))
+            .cast(pl.Int64, strict=False)
+        )
+    return pl.when(key.is_between(1, 10**14 - 1)).then(key)
+
+
+def load_cnpjs(path: str, validate: bool = True) -> pl.Series:
+    """
+    Lê uma lista de CNPJs (formato pela extensão: ver CNPJ_READERS) e
+    retorna as chaves inteiras únicas e ordenadas, no mesmo formato da
+    coluna CNPJ dos Parquets: Series Int64 "CNPJ".
+
+    Com validate, CNPJs com dígitos verificadores errados são descartados.
+    """
+    source = Path(path)
+    reader = CNPJ_READERS.get(source.suffix.lower())
+    if reader is None:
+        raise ValueError(
+            f"Formato de lista de CNPJs não suportado: {source.name} "
+            f"(aceitos: {', '.join(CNPJ_READERS)})"
+        )
+
+    lf = reader(source)
+    key = _to_key(pl.col("RAW"), lf.collect_schema()["RAW"])
+    keys = lf.select(key.alias("CNPJ")).collect().to_series()
+
+    sem_formato = keys.null_count()
+    keys = keys.drop_nulls()
+    dv_invalido = 0
+    if validate:
+        ok = dv_ok(keys)
+        dv_invalido = len(keys) - ok.sum()
+        keys = keys.filter(ok)
+    cnpjs = keys.unique().sort()
+
+    if sem_formato or dv_invalido:
+        print(
+            f"[WARN] {sem_formato + dv_invalido:,} valor(es) descartado(s): "
+            f"{sem_formato:,} sem 14 dígitos, {dv_invalido:,} com dígito verificador inválido."
+        )
+    print(f"[CNPJ] {len(cnpjs):,} CNPJs válidos carregados de {path}")
+    return cnpjs
@@ -2,6 +2,8 @@
 # config.py — Constantes do pipeline RFB
 # =============================================================================
 
+import polars as pl
+
 # Todas as colunas do CSV original — usadas na leitura para mapear posições
 COLS_ESTABELECIMENTO_RAW = [
     "CNPJ_BASICO", "CNPJ_ORDEM", "CNPJ_DV", "MATRIZ_FILIAL",
@@ -40,5 +42,206 @@ FILE_TYPES = {
     "EMPRE": COLS_EMPRESA,
 }
 
+# -----------------------------------------------------------------------------
+# Schema físico dos Parquets gravados na ingestão
+# -----------------------------------------------------------------------------
+# O CSV da RFB é lido todo como texto; na gravação cada coluna é convertida
+# para o tipo abaixo (ver downloader._to_schema):
+#   pl.Enum   — domínio fixo; valores fora do domínio viram null
+#   inteiros  — códigos numéricos (zeros à esquerda não têm significado)
+#   pl.Date   — datas AAAAMMDD; "0"/"00000000" viram null
+#   Float64   — CAPITAL_SOCIAL, com vírgula decimal no CSV
+#
+# CNPJ é uma chave única Int64 que compacta CNPJ_BASICO (8 dígitos),
+# CNPJ_ORDEM (4) e CNPJ_DV (2): BASICO * 10^6 + ORDEM * 10^2 + DV.
+# ORDEM e DV não são gravados separadamente (CNPJ % 10^6 // 100, CNPJ % 100).
+# Só CNPJs numéricos cabem na chave: um CNPJ alfanumérico viraria null.
+
+UFS = [
+    "AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS",
+    "MT", "PA", "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC",
+    "SE", "SP", "TO",
+    "EX",  # exterior
+]
+SITUACOES_CADASTRAIS = ["01", "02", "03", "04", "08"]
+PORTES_EMPRESA = ["00", "01", "03", "05"]
+
+SCHEMA_ESTABELECIMENTO = {
+    "CNPJ":                      pl.Int64,
+    "CNPJ_BASICO":               pl.Int32,
+    "MATRIZ_FILIAL":             pl.Int8,
+    "NOME_FANTASIA":             pl.Utf8,
+    "SITUACAO_CADASTRAL":        pl.Enum(SITUACOES_CADASTRAIS),
+    "DATA_SITUACAO_CADASTRAL":   pl.Date,
+    "MOTIVO_SITUACAO_CADASTRAL": pl.Int16,
+    "DATA_INICIO_ATIVIDADES":    pl.Date,
+    "CNAE_PRINCIPAL":            pl.Int32,
+    "CNAE_SECUNDARIA":           pl.Utf8,   # lista separada por vírgulas
+    "TIPO_LOGRADOURO":           pl.Utf8,
+    "LOGRADOURO":                pl.Utf8,
+    "NUMERO":                    pl.Utf8,   # pode conter "S/N", "KM 5" etc.
+    "COMPLEMENTO":               pl.Utf8,
+    "BAIRRO":                    pl.Utf8,
+    "CEP":                       pl.Utf8,
+    "UF":                        pl.Enum(UFS),
+    "MUNICIPIO":                 pl.Int32,  # código SIAFI
+    "DDD1":                      pl.Utf8,
+    "TELEFONE_1":                pl.Utf8,
+}
+
+SCHEMA_EMPRESA = {
+    "CNPJ_BASICO":              pl.Int32,
+    "RAZAO_SOCIAL":             pl.Utf8,
+    "NATUREZA_JURIDICA":        pl.Int16,
+    "QUALIFICACAO_RESPONSAVEL": pl.Int16,
+    "CAPITAL_SOCIAL":           pl.Float64,
+    "PORTE":                    pl.Enum(PORTES_EMPRESA),
+    "ENTE_FEDERATIVO":          pl.Utf8,
+}
+
+SCHEMAS = {
+    "ESTABELE": SCHEMA_ESTABELECIMENTO,
+    "EMPRE": SCHEMA_EMPRESA,
+}
+
+# Incrementar sempre que o schema acima mudar: Parquets registrados no
+# manifesto com outra versão são reconvertidos.
+SCHEMA_VERSION = 2
+
 # Tabela de mapeamento SIAFI ↔ IBGE (relativa à raiz do projeto)
 SIAFI_MAP_PATH = "data/Municipios_IBGE_SIAFI.csv"
+
+# -----------------------------------------------------------------------------
+# Perfis de gravação Parquet (ver parquet_io.py)
+# -----------------------------------------------------------------------------
+# Valem para todos os Parquets, intermediários e finais. row_group_size
+# também limita a RAM das conversões: o motor de streaming mantém poucos
+# row groups em memória por vez, independente do tamanho do arquivo.
+#   default — snappy: equilíbrio entre tamanho e velocidade
+#   archive — zstd nível alto: arquivos menores para guardar/sincronizar
+#   scratch — lz4: compressão e leitura mais rápidas para dados temporários
+
+PARQUET_ROW_GROUP_SIZE = 250_000
+
+PARQUET_PROFILES = {
+    "default": {"compression": "snappy", "compression_level": None},
+    "archive": {"compression": "zstd",   "compression_level": 12},
+    "scratch": {"compression": "lz4",    "compression_level": None},
+}
+
+PARQUET_PROFILE = "default"
+
+# -----------------------------------------------------------------------------
+# Layout dos Parquets na ingestão
+# -----------------------------------------------------------------------------
+# Por padrão ("flat") cada ZIP da RFB vira um Parquet, na ordem original.
+#
+# --sort-on-ingest ("sorted"): cada Parquet é ordenado pelas chaves abaixo
+# antes de ser gravado, em row groups menores. As estatísticas min/max de
+# cada row group passam a cobrir faixas estreitas dessas colunas, e os
+# filtros (is_in / ==) pulam os row groups que não podem conter o valor
+# procurado sem descomprimi-los. A ordenação materializa o arquivo inteiro
+# em memória durante a conversão.
+#   ESTABELE — filtro por município (UF, MUNICIPIO), depois CNPJ_BASICO
+#   EMPRE    — filtro por CNPJ_BASICO
+# O filtro por CNPJ completo em ESTABELE só se beneficia dentro de cada
+# município, já que a ordem principal é geográfica.
+#
+# --partition-on-ingest ("hive", só ESTABELE): a conversão grava direto em
+# ESTABELE/UF=MS/MUNICIPIO=9051/part-<zip>-<n>.parquet, e o filtro por
+# município vira uma busca de diretório. As colunas de partição continuam
+# dentro dos arquivos, então cada parte pode ser lida isoladamente.
+
+SORT_KEYS = {
+    "ESTABELE": ["UF", "MUNICIPIO", "CNPJ_BASICO"],
+    "EMPRE":    ["CNPJ_BASICO"],
+}
+
+SORTED_ROW_GROUP_SIZE = 50_000
+
+PARTITION_KEYS = ["UF", "MUNICIPIO"]
+
+# -----------------------------------------------------------------------------
+# Filtragem paralela (ver filterer._scan_workers)
+# -----------------------------------------------------------------------------
+# Os filtros escaneiam vários arquivos (ou grupos de arquivos) ao mesmo
+# tempo. O número de scans simultâneos é o menor entre --filter-workers e
+# quantos cabem em FILTER_MEMORY_MB, estimando o pico de cada scan como
+# FILTER_SCAN_EXPANSION × o tamanho em disco do maior grupo.
+
+FILTER_MEMORY_MB = 2048
+FILTER_SCAN_EXPANSION = 4
+
+# -----------------------------------------------------------------------------
+# Índice de CNPJ (--cnpj-index, ver cnpj_index.py)
+# -----------------------------------------------------------------------------
+# Listas com até CNPJ_INDEX_MAX_KEYS CNPJs são buscadas pelo índice; acima
+# disso a busca binária uma a uma perde para a varredura dos arquivos.
+# Cada Parquet é lido com um slice por row group que tem CNPJs pedidos,
+# nos limites reais dos row groups (gravados no índice). O ganho é
+# proporcional aos row groups sem nenhum CNPJ pedido: listas pequenas e
+# row groups menores (--row-group-size, --sort-on-ingest) rendem mais.
+
+CNPJ_INDEX_MAX_KEYS = 100_000
+
+# -----------------------------------------------------------------------------
+# Casamento da lista de CNPJs nos filtros (ver filterer._match_keys)
+# -----------------------------------------------------------------------------
+# A lista é carregada uma vez como Series tipada (Int64/Int32) e casada com
+# cada arquivo por uma de três estratégias, conforme o número de chaves:
+#   is_in — até CNPJ_SEMI_JOIN_MIN_KEYS: menor uso de memória e poda de row
+#           groups pelas estatísticas
+#   semi  — semi-join hash contra a lista como DataFrame; com milhões de
+#           chaves fica mais rápido que o is_in (benchmarks/bench_cnpj_filter.py)
+#   merge — ordena cada arquivo e faz join com a lista ordenada. Desligado
+#           (None): nos benchmarks a ordenação dos arquivos custa mais do
+#           que o hash economiza
+# As estratégias só valem para a varredura; o índice de CNPJ tem seu próprio
+# limite (CNPJ_INDEX_MAX_KEYS).
+
+CNPJ_SEMI_JOIN_MIN_KEYS = 1_000_000
+CNPJ_SORT_MERGE_MIN_KEYS: int | None = None
+
+# -----------------------------------------------------------------------------
+# Filtros de Bloom sobre CNPJ_BASICO (ver bloom.py)
+# -----------------------------------------------------------------------------
+# Gravados na ingestão ao lado de cada Parquet de ESTABELE e EMPRE.
+# 10 bits por chave com 7 hashes ≈ 1% de falsos positivos. Listas com mais
+# de BLOOM_MAX_KEYS CNPJ_BASICO não consultam os filtros: com tantas chaves
+# quase todo arquivo teria algum acerto.
+
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+BLOOM_MAX_KEYS = 10_000
+
+# -----------------------------------------------------------------------------
+# Cache de coordenadas (ver enricher.CoordsCache)
+# -----------------------------------------------------------------------------
+# Cada coord_{UF}.parquet é lido e padronizado uma vez por execução; as UFs
+# ficam em memória até somarem COORDS_CACHE_MB, e a usada há mais tempo é
+# descartada primeiro.
+
+COORDS_CACHE_MB = 2048
+
+# -----------------------------------------------------------------------------
+# Store de coordenadas padronizadas (ver build_coords.py)
+# -----------------------------------------------------------------------------
+# build_coords.py padroniza cada coord_{UF}.parquet uma vez e grava
+# coord_{UF}.store/COD_MUNICIPIO=<ibge>/*.parquet no mesmo diretório: CEP e
+# número como Int32, latitude/longitude Float32, ordenado por CEP + número.
+# O enriquecimento lê o store direto (sem limpeza) enquanto ele for da
+# versão abaixo e do mesmo coord_{UF}.parquet (tamanho e hash do rodapé,
+# que sobrevive a downloads); senão padroniza o original.
+
+COORDS_STORE_VERSION = 1
+
+# -----------------------------------------------------------------------------
+# Qualidade das coordenadas (ver enricher._enrich_cep_numero)
+# -----------------------------------------------------------------------------
+# Cada estabelecimento enriquecido recebe GEO_METHOD (EXATO, APROXIMADO ou
+# NOMINATIM) e, nos merges por CEP, GEO_NUM_DELTA: a distância entre o seu
+# número e o do ponto usado (0 no exato). GEO_MAX_NUM_DELTA limita essa
+# distância no merge aproximado (--geo-max-num-delta); None aceita qualquer
+# vizinho do mesmo CEP.
+
+GEO_MAX_NUM_DELTA: int | None = None
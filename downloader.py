@@ -1,6 +1,12 @@
 # =============================================================================
-# downloader.py — Download ZIP → extrai CSV → deleta ZIP → converte Parquet
-#                 → deleta CSV. Controla paralelismo via ThreadPoolExecutor.
+# downloader.py — Download ZIP → converte o CSV (latin1) em Parquet → deleta
+#                 ZIP. Controla paralelismo via ThreadPoolExecutor.
+#
+# Modos de conversão (convert_mode):
+#   "stream" — lê o CSV direto do ZIP, decodifica latin1 em blocos na memória
+#              e grava o Parquet incrementalmente (sink_parquet). Nada além
+#              do ZIP e do Parquet final passa pelo disco.
+#   "disk"   — grava o CSV convertido para utf8 em disco e faz scan_csv.
 #
 # A Receita Federal migrou para Nextcloud. A API utilizada é WebDAV sobre
 # share público, sem necessidade de login:
@@ -9,25 +15,45 @@
 #   Auth: HTTPBasicAuth(SHARE_TOKEN, "")
 # =============================================================================
 
+import json
+import os
+import queue
+import random
 import re
-import subprocess
+import shutil
+import threading
 import time
 import xml.etree.ElementTree as ET
 import zipfile
+from collections.abc import Callable, Iterator
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import polars as pl
 import requests
+from polars.io.plugins import register_io_source
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-
-from config import COLS_ESTABELECIMENTO, COLS_ESTABELECIMENTO_RAW, FILE_TYPES
+from urllib3.util.retry import Retry
+
+from config import (
+    COLS_ESTABELECIMENTO_RAW,
+    FILE_TYPES,
+    PARTITION_KEYS,
+    SCHEMAS,
+    SORT_KEYS,
+    SORTED_ROW_GROUP_SIZE,
+)
+from bloom import bloom_path, write_bloom
+from manifest import Manifest
+from parquet_io import sink_parquet
 
 # ---------------------------------------------------------------------------
 # Configuração da nova plataforma Nextcloud
 # ---------------------------------------------------------------------------
 
-NEXTCLOUD_HOST  = "https://arquivos.receitafederal.gov.br"
+# RFB_NEXTCLOUD_HOST permite apontar para um servidor WebDAV local (testes)
+NEXTCLOUD_HOST  = os.environ.get("RFB_NEXTCLOUD_HOST", "https://arquivos.receitafederal.gov.br")
 SHARE_TOKEN     = "gn672Ad4CF8N6TK"
 SHARE_BASE_PATH = "/Dados/Cadastros/CNPJ"
 WEBDAV_BASE     = f"{NEXTCLOUD_HOST}/public.php/webdav"
@@ -36,9 +62,75 @@ AUTH            = HTTPBasicAuth(SHARE_TOKEN, "")
 # Namespace WebDAV usado nas respostas XML
 _DAV_NS = {"d": "DAV:"}
 
-# Número de tentativas para download e espera entre elas
-_DOWNLOAD_RETRIES = 3
-_RETRY_WAIT_SECS  = 30
+# Política HTTP única para PROPFIND e downloads: timeout (conexão, leitura)
+# e retry automático de falhas de conexão/5xx feito pelo próprio pool
+_HTTP_TIMEOUT = (30, 600)
+_HTTP_RETRY   = Retry(
+    total=3,
+    backoff_factor=2,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET", "PROPFIND"}),
+    raise_on_status=False,
+)
+
+# Tentativas seguidas sem progresso antes de desistir de um download e
+# backoff exponencial entre elas (base * 2^(n-1), limitado a _RETRY_MAX_SECS)
+_DOWNLOAD_RETRIES = 6
+_RETRY_BASE_SECS  = 5
+_RETRY_MAX_SECS   = 300
+
+# Tamanho dos blocos gravados no arquivo parcial durante o download (é também
+# a perda máxima de progresso quando a conexão cai no meio de um bloco)
+_DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Tamanho mínimo de cada segmento no download segmentado; arquivos menores
+# que segments * _MIN_SEGMENT_BYTES são baixados numa conexão só
+_MIN_SEGMENT_BYTES = 16 * 1024 * 1024
+
+# Modos de conversão ZIP → Parquet aceitos por download_all
+CONVERT_MODES = ("stream", "disk")
+
+# Tamanho dos blocos (descomprimidos) lidos do ZIP no modo "stream".
+# Limita a RAM de cada worker a alguns múltiplos deste valor.
+_STREAM_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+# ---------------------------------------------------------------------------
+# Sessão HTTP compartilhada (keep-alive + pool de conexões)
+# ---------------------------------------------------------------------------
+
+_session: requests.Session | None = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+
+def configure_session(pool_size: int) -> requests.Session:
+    """
+    Garante que a sessão compartilhada comporte pool_size conexões
+    simultâneas ao host (uma por download/segmento em andamento).
+    Só recria o adapter quando o pool atual é menor que o pedido.
+    """
+    global _session, _session_pool_size
+
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.auth = AUTH
+        if pool_size > _session_pool_size:
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=pool_size,
+                max_retries=_HTTP_RETRY,
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session_pool_size = pool_size
+        return _session
+
+
+def _get_session() -> requests.Session:
+    """Sessão compartilhada por PROPFIND e downloads (thread-safe)."""
+    return _session if _session is not None else configure_session(4)
 
 
 # ---------------------------------------------------------------------------
@@ -48,15 +140,14 @@ _RETRY_WAIT_SECS  = 30
 def _propfind(path: str) -> list[dict]:
     """
     Faz PROPFIND no path relativo ao share e retorna lista de entradas.
-    Cada entrada é um dict com: href, name, is_dir, size.
+    Cada entrada é um dict com: href, name, is_dir, size, etag.
     """
     url = f"{WEBDAV_BASE}{path}"
-    resp = requests.request(
+    resp = _get_session().request(
         "PROPFIND",
         url,
-        auth=AUTH,
         headers={"Depth": "1"},
-        timeout=30,
+        timeout=_HTTP_TIMEOUT,
     )
     resp.raise_for_status()
 
@@ -69,6 +160,7 @@ def _propfind(path: str) -> list[dict]:
         name = clean_href.rstrip("/").split("/")[-1]
         is_dir = response.find(".//d:collection", _DAV_NS) is not None
         size_text = response.findtext(".//d:getcontentlength", default="0", namespaces=_DAV_NS)
+        etag = response.findtext(".//d:getetag", default="", namespaces=_DAV_NS)
 
         # Ignora a própria pasta (entrada raiz do PROPFIND)
         if clean_href.rstrip("/") == path.rstrip("/"):
@@ -79,6 +171,7 @@ def _propfind(path: str) -> list[dict]:
             "name": name,
             "is_dir": is_dir,
             "size": int(size_text or 0),
+            "etag": etag or None,
         })
 
     return entries
@@ -106,9 +199,10 @@ def get_latest_month() -> str:
 # Listagem de arquivos ZIP do mês
 # ---------------------------------------------------------------------------
 
-def list_zip_files(month: str, file_type: str) -> list[tuple[str, str]]:
+def list_zip_files(month: str, file_type: str) -> list[dict]:
     """
-    Retorna lista de (nome_arquivo, url_download) dos ZIPs do tipo informado.
+    Retorna os ZIPs do tipo informado. Cada item é um dict com:
+    name, url, size (getcontentlength) e etag (getetag, ou None).
 
     Args:
         month:     "2025-11"
@@ -120,154 +214,567 @@ def list_zip_files(month: str, file_type: str) -> list[tuple[str, str]]:
     for e in entries:
         name = e["name"]
         if name.lower().endswith(".zip") and file_type.upper() in name.upper():
-            url = f"{WEBDAV_BASE}{e['href']}"
-            result.append((name, url))
+            result.append({
+                "name": name,
+                "url": f"{WEBDAV_BASE}{e['href']}",
+                "size": e["size"],
+                "etag": e["etag"],
+            })
     return result
 
 
 # ---------------------------------------------------------------------------
-# Download com retry
+# Download retomável (HTTP Range) com retry
 # ---------------------------------------------------------------------------
 
-def _download_with_retry(filename: str, url: str, zip_path: Path) -> None:
+def _backoff_secs(attempt: int) -> float:
+    """Espera exponencial com jitter para a tentativa `attempt` (1, 2, ...)."""
+    wait = min(_RETRY_MAX_SECS, _RETRY_BASE_SECS * 2 ** (attempt - 1))
+    return wait * random.uniform(0.8, 1.2)
+
+
+def _load_checkpoint(part_path: Path, size: int | None, etag: str | None) -> dict | None:
     """
-    Baixa um arquivo ZIP com até _DOWNLOAD_RETRIES tentativas.
-    Remove arquivo parcial antes de cada nova tentativa.
+    Lê o checkpoint ({part}.json) de um download parcial.
+    O parcial só vale se o checkpoint registra o mesmo tamanho e ETag
+    anunciados agora pelo PROPFIND; senão é descartado e retorna None.
     """
-    for attempt in range(1, _DOWNLOAD_RETRIES + 1):
+    meta_path = part_path.with_name(part_path.name + ".json")
+    if not part_path.exists() or not meta_path.exists():
+        part_path.unlink(missing_ok=True)
+        return None
+
+    meta = json.loads(meta_path.read_text())
+    if meta.get("size") != size or meta.get("etag") != etag:
+        print(f"[DOWN] {part_path.name} desatualizado — recomeçando do zero.")
+        part_path.unlink()
+        return None
+    return meta
+
+
+def _save_checkpoint(part_path: Path, meta: dict) -> None:
+    meta_path = part_path.with_name(part_path.name + ".json")
+    meta_path.write_text(json.dumps(meta))
+
+
+def _finish_download(part_path: Path, zip_path: Path) -> None:
+    part_path.replace(zip_path)
+    part_path.with_name(part_path.name + ".json").unlink(missing_ok=True)
+
+
+def _download_with_retry(
+    filename: str,
+    url: str,
+    zip_path: Path,
+    size: int | None = None,
+    etag: str | None = None,
+    segments: int = 1,
+) -> None:
+    """
+    Baixa um arquivo ZIP retomando de onde parou em caso de falha.
+    Com segments > 1 (e tamanho conhecido) delega a _download_segmented.
+
+    Os bytes são gravados em {zip}.part; a cada nova tentativa o download
+    continua com "Range: bytes={n}-" a partir do último byte gravado, com
+    "If-Range: {etag}" para o servidor devolver o arquivo inteiro (200) se
+    ele tiver mudado. size/etag vêm do PROPFIND e validam tanto o parcial
+    reaproveitado quanto o arquivo final.
+
+    Desiste após _DOWNLOAD_RETRIES tentativas seguidas sem nenhum progresso,
+    esperando _backoff_secs() entre elas.
+    """
+    if segments > 1 and size and size >= segments * _MIN_SEGMENT_BYTES:
+        _download_segmented(filename, url, zip_path, size, etag, segments)
+        return
+
+    part_path = zip_path.with_name(zip_path.name + ".part")
+    meta = _load_checkpoint(part_path, size, etag)
+    if meta is None or "segments" in meta or (size and part_path.stat().st_size > size):
+        # Sem checkpoint válido, ou parcial de um download segmentado
+        part_path.unlink(missing_ok=True)
+        offset = 0
+    else:
+        offset = part_path.stat().st_size
+    _save_checkpoint(part_path, {"size": size, "etag": etag})
+    attempt = 0
+
+    while True:
+        attempt += 1
+        start = offset
         try:
-            print(f"[DOWN] Baixando {filename} (tentativa {attempt}/{_DOWNLOAD_RETRIES})...")
-            with requests.get(url, auth=AUTH, stream=True, timeout=600) as r:
+            headers = {}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+                if etag:
+                    headers["If-Range"] = etag
+                print(f"[DOWN] Retomando {filename} a partir de {offset:,} bytes "
+                      f"(tentativa {attempt}/{_DOWNLOAD_RETRIES})...")
+            else:
+                print(f"[DOWN] Baixando {filename} (tentativa {attempt}/{_DOWNLOAD_RETRIES})...")
+
+            with _get_session().get(url, headers=headers, stream=True, timeout=_HTTP_TIMEOUT) as r:
+                if r.status_code == 416 and size and offset == size:
+                    pass  # parcial já estava completo
+                else:
+                    r.raise_for_status()
+                    content_range = r.headers.get("Content-Range", "")
+                    if r.status_code == 206 and not content_range.startswith(f"bytes {offset}-"):
+                        raise OSError(f"Content-Range inesperado: {content_range!r}")
+                    if r.status_code != 206:
+                        # Servidor ignorou o Range (ou o arquivo mudou): recomeça
+                        offset = 0
+                    with open(part_path, "r+b" if offset else "wb") as f:
+                        f.seek(offset)
+                        f.truncate()
+                        for chunk in r.iter_content(chunk_size=_DOWNLOAD_CHUNK_BYTES):
+                            f.write(chunk)
+                            offset += len(chunk)
+
+            if size and offset != size:
+                raise OSError(f"download incompleto: {offset:,} de {size:,} bytes")
+
+            _finish_download(part_path, zip_path)
+            return  # sucesso
+        except Exception as exc:
+            if offset > start:
+                attempt = 0  # houve progresso: só conta falhas consecutivas
+            if attempt >= _DOWNLOAD_RETRIES:
+                raise
+            wait = _backoff_secs(max(attempt, 1))
+            print(f"[RETRY] {filename} falhou em {offset:,} bytes ({exc}). "
+                  f"Aguardando {wait:.0f}s...")
+            time.sleep(wait)
+
+
+# ---------------------------------------------------------------------------
+# Download segmentado: N conexões, cada uma buscando um intervalo de bytes
+# ---------------------------------------------------------------------------
+
+def _fetch_segment(
+    url: str,
+    part_path: Path,
+    segment: list[int],
+    etag: str | None,
+    checkpoint: Callable[[], None],
+) -> None:
+    """
+    Baixa o intervalo [segment[0], segment[1]] (inclusivo) para a posição
+    correspondente do arquivo pré-alocado. segment[0] avança a cada bloco
+    gravado, de modo que uma nova tentativa (ou execução) continua dali.
+    """
+    attempt = 0
+    while segment[0] <= segment[1]:
+        attempt += 1
+        start = segment[0]
+        try:
+            headers = {"Range": f"bytes={segment[0]}-{segment[1]}"}
+            if etag:
+                headers["If-Range"] = etag
+            with _get_session().get(url, headers=headers, stream=True, timeout=_HTTP_TIMEOUT) as r:
                 r.raise_for_status()
-                with open(zip_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8 * 1024 * 1024):
+                content_range = r.headers.get("Content-Range", "")
+                if r.status_code != 206 or not content_range.startswith(f"bytes {segment[0]}-"):
+                    raise OSError(
+                        f"servidor não atendeu o Range (HTTP {r.status_code}, "
+                        f"Content-Range={content_range!r})"
+                    )
+                with open(part_path, "r+b") as f:
+                    f.seek(segment[0])
+                    for chunk in r.iter_content(chunk_size=_DOWNLOAD_CHUNK_BYTES):
+                        chunk = chunk[: segment[1] - segment[0] + 1]
                         f.write(chunk)
-            return  # sucesso
+                        segment[0] += len(chunk)
+            checkpoint()
         except Exception as exc:
-            zip_path.unlink(missing_ok=True)
-            if attempt < _DOWNLOAD_RETRIES:
-                print(f"[RETRY] {filename} falhou ({exc}). Aguardando {_RETRY_WAIT_SECS}s...")
-                time.sleep(_RETRY_WAIT_SECS)
-            else:
+            checkpoint()
+            if segment[0] > start:
+                attempt = 0  # houve progresso: só conta falhas consecutivas
+            if attempt >= _DOWNLOAD_RETRIES:
                 raise
+            wait = _backoff_secs(max(attempt, 1))
+            print(f"[RETRY] Segmento {segment[0]:,}-{segment[1]:,} falhou ({exc}). "
+                  f"Aguardando {wait:.0f}s...")
+            time.sleep(wait)
+
+
+def _download_segmented(
+    filename: str,
+    url: str,
+    zip_path: Path,
+    size: int,
+    etag: str | None,
+    segments: int,
+) -> None:
+    """
+    Divide o arquivo em `segments` intervalos de bytes e baixa todos em
+    paralelo para um {zip}.part pré-alocado com o tamanho final.
+
+    O checkpoint guarda a posição atual de cada segmento, então falhas e
+    novas execuções retomam cada intervalo do ponto onde parou (mesma
+    validação por tamanho/ETag do download simples). Ao final confere se
+    todos os segmentos terminaram e se o arquivo tem o tamanho anunciado.
+    """
+    part_path = zip_path.with_name(zip_path.name + ".part")
+    meta = _load_checkpoint(part_path, size, etag)
+
+    if meta is not None and len(meta.get("segments", [])) == segments:
+        ranges = meta["segments"]
+        print(f"[DOWN] Retomando {filename} em {segments} segmentos...")
+    else:
+        part_path.unlink(missing_ok=True)
+        step = -(-size // segments)
+        ranges = [[i, min(i + step, size) - 1] for i in range(0, size, step)]
+        with open(part_path, "wb") as f:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+        print(f"[DOWN] Baixando {filename} em {len(ranges)} segmentos...")
+
+    lock = threading.Lock()
+
+    def checkpoint() -> None:
+        with lock:
+            _save_checkpoint(part_path, {"size": size, "etag": etag, "segments": ranges})
+
+    checkpoint()
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [
+            executor.submit(_fetch_segment, url, part_path, seg, etag, checkpoint)
+            for seg in ranges
+        ]
+        for future in as_completed(futures):
+            future.result()
+
+    pendentes = [seg for seg in ranges if seg[0] <= seg[1]]
+    if pendentes or part_path.stat().st_size != size:
+        raise OSError(
+            f"download segmentado incompleto: {part_path.stat().st_size:,} de "
+            f"{size:,} bytes, {len(pendentes)} segmento(s) pendente(s)"
+        )
+
+    _finish_download(part_path, zip_path)
 
 
 # ---------------------------------------------------------------------------
-# Conversão de encoding latin1 → utf8 via iconv (streaming, sem RAM extra)
+# Transcodificação latin1 → utf8 em blocos, direto do ZIP (sem iconv)
 # ---------------------------------------------------------------------------
 
-def _latin1_to_utf8(src: Path, dst: Path) -> None:
+def _iter_utf8_chunks(zip_path: Path, member: str, chunk_bytes: int) -> Iterator[bytes]:
     """
-    Converte o arquivo src de latin1 para utf8 usando iconv.
-    Processa em streaming — não carrega o arquivo na RAM.
-    O arquivo src é deletado após a conversão.
+    Lê o membro CSV do ZIP em blocos de ~chunk_bytes, sempre cortando em fim
+    de registro, e devolve cada bloco já convertido de latin1 para utf8.
+    Nenhum arquivo intermediário é gravado.
     """
-    print(f"[ENCO] Convertendo encoding {src.name} → utf8...")
-    subprocess.run(
-        ["iconv", "-f", "latin1", "-t", "utf-8", str(src), "-o", str(dst)],
-        check=True,
-    )
-    src.unlink()
+    with zipfile.ZipFile(zip_path) as z, z.open(member) as src:
+        resto = b""
+        while True:
+            bloco = src.read(chunk_bytes)
+            if not bloco:
+                break
+            bloco = resto + bloco
+            # Os campos da RFB vêm sempre entre aspas: '"\n' marca o fim de um
+            # registro com mais segurança que um '\n' solto dentro de um campo.
+            corte = bloco.rfind(b'"\n') + 2
+            if corte == 1:
+                corte = bloco.rfind(b"\n") + 1
+            if corte == 0:
+                resto = bloco
+                continue
+            resto = bloco[corte:]
+            yield bloco[:corte].decode("latin1").encode("utf-8")
+
+        if resto.strip():
+            yield resto.decode("latin1").encode("utf-8")
+
+
+def _latin1_to_utf8(zip_path: Path, member: str, dst: Path) -> None:
+    """
+    Grava em dst o CSV `member` do ZIP convertido de latin1 para utf8.
+    Lê e decodifica em blocos (RAM limitada a _STREAM_CHUNK_BYTES) e grava
+    o CSV uma única vez — sem extração prévia nem processo externo.
+    """
+    print(f"[ENCO] Convertendo encoding {member} → utf8...")
+    with open(dst, "wb") as f:
+        for chunk in _iter_utf8_chunks(zip_path, member, _STREAM_CHUNK_BYTES):
+            f.write(chunk)
 
 
 # ---------------------------------------------------------------------------
-# Processamento de um único ZIP
+# Leitura do CSV direto do ZIP (modo "stream")
 # ---------------------------------------------------------------------------
 
-def _process_one_zip(
-    filename: str,
-    url: str,
-    dest_dir: Path,
-    columns: list[str],
-) -> Path:
+def _scan_zip_csv(zip_path: Path, member: str, columns: list[str]) -> pl.LazyFrame:
     """
-    Pipeline completo para um arquivo ZIP:
-      1. Download em streaming com retry
-      2. Extração do CSV (latin1)
-      3. Deleção do ZIP
-      4. iconv: latin1 → utf8  (streaming, sem custo de RAM)
-      5. Deleção do CSV latin1
-      6. scan_csv utf8 → filtra → Parquet  (streaming via LazyFrame)
-      7. Deleção do CSV utf8
+    Expõe o CSV latin1 contido no ZIP como LazyFrame (todas as colunas Utf8).
+    Os blocos são lidos sob demanda pelo motor de streaming do Polars, então
+    filtros e select aplicados sobre o LazyFrame rodam bloco a bloco.
+    """
+    schema = {c: pl.Utf8 for c in columns}
+
+    def source(
+        with_columns: list[str] | None,
+        predicate: pl.Expr | None,
+        n_rows: int | None,
+        batch_size: int | None,
+    ) -> Iterator[pl.DataFrame]:
+        for chunk in _iter_utf8_chunks(zip_path, member, _STREAM_CHUNK_BYTES):
+            df = pl.read_csv(
+                chunk,
+                separator=";",
+                has_header=False,
+                new_columns=columns,
+                infer_schema=False,
+                truncate_ragged_lines=True,
+                null_values=[""],
+            )
+            if predicate is not None:
+                df = df.filter(predicate)
+            if with_columns is not None:
+                df = df.select(with_columns)
+            if n_rows is not None:
+                df = df.head(n_rows)
+                n_rows -= len(df)
+            yield df
+            if n_rows == 0:
+                break
+
+    return register_io_source(source, schema=schema)
+
 
-    Retorna o caminho do Parquet gerado.
-    Pula silenciosamente se o Parquet já existir.
+def _to_schema(lf: pl.LazyFrame, schema: dict[str, pl.DataType]) -> pl.LazyFrame:
     """
-    parquet_path = dest_dir / f"{filename}.parquet"
+    Seleciona as colunas de `schema` (config.SCHEMAS) e converte o texto do
+    CSV para o tipo físico de cada uma. Valores que não convertem viram null.
+    """
+    exprs = []
+    for name, dtype in schema.items():
+        if name == "CNPJ":
+            # Chave compactada: BASICO * 10^6 + ORDEM * 10^2 + DV
+            expr = (
+                pl.col("CNPJ_BASICO").cast(pl.Int64, strict=False) * 1_000_000
+                + pl.col("CNPJ_ORDEM").cast(pl.Int64, strict=False) * 100
+                + pl.col("CNPJ_DV").cast(pl.Int64, strict=False)
+            )
+        elif dtype == pl.Date:
+            expr = pl.col(name).str.to_date("%Y%m%d", strict=False)
+        elif dtype == pl.Float64:
+            expr = pl.col(name).str.replace(",", ".", literal=True).cast(pl.Float64, strict=False)
+        elif dtype == pl.Utf8:
+            expr = pl.col(name)
+        else:
+            expr = pl.col(name).cast(dtype, strict=False)
+        exprs.append(expr.alias(name))
+    return lf.select(exprs)
+
 
-    if parquet_path.exists():
-        print(f"[SKIP] {filename} — parquet já existe.")
-        return parquet_path
+def _clean(lf: pl.LazyFrame, is_estabele: bool) -> pl.LazyFrame:
+    """Filtros e tipagem aplicados ao CSV bruto antes de gravar o Parquet."""
+    if is_estabele:
+        lf = lf.filter(pl.col("SITUACAO_CADASTRAL") == "02")
+    return _to_schema(lf, SCHEMAS["ESTABELE" if is_estabele else "EMPRE"])
 
-    # 1. Download com retry
-    zip_path = dest_dir / filename
-    _download_with_retry(filename, url, zip_path)
 
-    # 2. Extração
-    print(f"[EXTR] Extraindo {filename}...")
+def _sink(
+    lf: pl.LazyFrame,
+    parquet_path: Path,
+    sort_keys: list[str] | None,
+    partition_keys: list[str] | None = None,
+) -> None:
+    """
+    Grava o Parquet convertido. Com sort_keys, ordena antes de gravar e usa
+    row groups menores (SORTED_ROW_GROUP_SIZE) para que as estatísticas
+    min/max permitam pular row groups nos filtros. Com partition_keys,
+    parquet_path é um diretório e recebe um layout hive (chave=valor/...).
+    """
+    overrides = {}
+    if sort_keys:
+        lf = lf.sort(sort_keys)
+        overrides["row_group_size"] = SORTED_ROW_GROUP_SIZE
+    if partition_keys:
+        target = pl.PartitionBy(parquet_path, key=partition_keys, include_key=True)
+        sink_parquet(lf, target, **overrides)
+    else:
+        sink_parquet(lf, parquet_path, **overrides)
+
+
+def _convert_zip_stream(
+    zip_path: Path,
+    parquet_path: Path,
+    columns: list[str],
+    is_estabele: bool,
+    sort_keys: list[str] | None = None,
+    partition_keys: list[str] | None = None,
+) -> None:
+    """
+    Converte o(s) CSV(s) do ZIP em um único Parquet sem extrair nada para o
+    disco: ZIP → blocos latin1 → utf8 em memória → sink_parquet incremental.
+    """
     with zipfile.ZipFile(zip_path) as z:
-        csv_names = z.namelist()
-        z.extractall(dest_dir)
+        csv_names = [n for n in z.namelist() if not n.endswith("/")]
 
-    # 3. Deleta ZIP imediatamente para liberar disco
-    zip_path.unlink()
+    raw_columns = COLS_ESTABELECIMENTO_RAW if is_estabele else columns
+    frames = [
+        _clean(_scan_zip_csv(zip_path, csv_name, raw_columns), is_estabele)
+        for csv_name in csv_names
+    ]
 
-    is_estabele = "ESTABELE" in filename.upper()
+    print(f"[CONV] Convertendo {zip_path.name} → {parquet_path.name} (stream)...")
+    _sink(pl.concat(frames, how="vertical"), parquet_path, sort_keys, partition_keys)
 
-    for csv_name in csv_names:
-        csv_path = dest_dir / csv_name
-        if not csv_path.exists():
-            continue
 
-        # 4. Converte latin1 → utf8 via iconv (streaming)
-        utf8_path = csv_path.with_suffix(".utf8.csv")
-        _latin1_to_utf8(csv_path, utf8_path)
-        # csv_path (latin1) já foi deletado dentro de _latin1_to_utf8
+def _convert_zip_disk(
+    zip_path: Path,
+    parquet_path: Path,
+    columns: list[str],
+    is_estabele: bool,
+    sort_keys: list[str] | None = None,
+    partition_keys: list[str] | None = None,
+) -> None:
+    """
+    Converte o(s) CSV(s) do ZIP passando por um CSV utf8 em disco:
+    ZIP → CSV utf8 (transcodificado em blocos) → scan_csv → sink_parquet.
+    Os CSVs utf8 são deletados ao final, mesmo em caso de erro.
+    """
+    with zipfile.ZipFile(zip_path) as z:
+        csv_names = [n for n in z.namelist() if not n.endswith("/")]
+
+    raw_columns = COLS_ESTABELECIMENTO_RAW if is_estabele else columns
+    utf8_paths = [
+        parquet_path.parent / f"{Path(csv_name).name}.utf8.csv" for csv_name in csv_names
+    ]
 
-        print(f"[CONV] Convertendo {csv_name} → {parquet_path.name}...")
+    try:
+        for csv_name, utf8_path in zip(csv_names, utf8_paths):
+            _latin1_to_utf8(zip_path, csv_name, utf8_path)
 
-        # 5. scan_csv em streaming (utf8, sem carregar tudo na RAM)
-        if is_estabele:
-            df = (
+        frames = [
+            _clean(
                 pl.scan_csv(
                     utf8_path,
                     separator=";",
                     has_header=False,
-                    new_columns=COLS_ESTABELECIMENTO_RAW,
+                    new_columns=raw_columns,
                     infer_schema_length=0,
                     truncate_ragged_lines=True,
                     null_values=[""],
-                )
-                .filter(pl.col("SITUACAO_CADASTRAL") == "02")
-                .select(COLS_ESTABELECIMENTO)
-                .collect()
+                ),
+                is_estabele,
             )
-            print(f"[FILT] Ativos retidos: {len(df):,}")
+            for utf8_path in utf8_paths
+        ]
+
+        print(f"[CONV] Convertendo {zip_path.name} → {parquet_path.name} (disk)...")
+        _sink(pl.concat(frames, how="vertical"), parquet_path, sort_keys, partition_keys)
+    finally:
+        for utf8_path in utf8_paths:
+            utf8_path.unlink(missing_ok=True)
+
+
+# ---------------------------------------------------------------------------
+# Conversão de um único ZIP já baixado
+# ---------------------------------------------------------------------------
+
+# Diretórios de partição do layout hive (UF=*/MUNICIPIO=*)
+_HIVE_DIRS = "/".join(f"{k}=*" for k in PARTITION_KEYS)
+
+
+def _hive_parts_glob(filename: str) -> str:
+    """Padrão (relativo ao diretório do tipo) das partes hive geradas por um ZIP."""
+    return f"{_HIVE_DIRS}/part-{Path(filename).stem}-*.parquet"
+
+
+def _outputs_on_disk(dest_dir: Path, filename: str, layout: str) -> list[Path]:
+    """Parquets de um ZIP presentes em dest_dir no layout informado."""
+    if layout == "hive":
+        return sorted(dest_dir.glob(_hive_parts_glob(filename)))
+    parquet_path = dest_dir / f"{filename}.parquet"
+    return [parquet_path] if parquet_path.exists() else []
+
+
+def _convert_zip(
+    filename: str,
+    zip_path: Path,
+    parquet_path: Path,
+    columns: list[str],
+    convert_mode: str = "stream",
+    sort_on_ingest: bool = False,
+    partition_on_ingest: bool = False,
+) -> list[Path]:
+    """
+    Converte um ZIP já baixado em Parquet. O ZIP é sempre deletado ao final.
+
+    Modo "stream" (padrão):
+      1. CSV lido direto do ZIP, latin1 → utf8 em blocos na memória
+      2. Filtra → Parquet gravado incrementalmente (sink_parquet)
+
+    Modo "disk":
+      1. CSV do ZIP → CSV utf8 em disco (transcodificado em blocos)
+      2. scan_csv utf8 → filtra → Parquet gravado incrementalmente
+      3. Deleção do CSV utf8
+
+    Nos dois modos o Parquet é gravado pelo motor de streaming do Polars,
+    em row groups do perfil de parquet_io: o pico de RAM por worker depende
+    do tamanho do bloco/row group, não do tamanho do arquivo.
+
+    Com sort_on_ingest, o Parquet é ordenado por config.SORT_KEYS do tipo
+    de arquivo antes da gravação; nesse caso o arquivo inteiro passa pela
+    memória do worker.
+
+    Com partition_on_ingest (só ESTABELE), em vez de parquet_path são
+    gravadas partes UF=../MUNICIPIO=../part-<zip>-<n>.parquet ao lado dele.
+
+    Cada Parquet gerado ganha um filtro de Bloom de CNPJ_BASICO
+    ({parquet}.bloom), consultado pelos filtros por CNPJ.
+
+    Retorna os Parquets gerados (um só, ou uma parte por município).
+    """
+    is_estabele = "ESTABELE" in filename.upper()
+    convert = _convert_zip_stream if convert_mode == "stream" else _convert_zip_disk
+    sort_keys = SORT_KEYS["ESTABELE" if is_estabele else "EMPRE"] if sort_on_ingest else None
+    partition_keys = PARTITION_KEYS if partition_on_ingest and is_estabele else None
+
+    # Grava em arquivo (ou diretório) temporário: um Parquet truncado por
+    # falha no meio da conversão nunca fica com o nome final (que seria
+    # pulado depois).
+    tmp_path = parquet_path.with_suffix(".parquet.tmp")
+    outputs: list[Path] = []
+    try:
+        convert(zip_path, tmp_path, columns, is_estabele, sort_keys, partition_keys)
+        if partition_keys:
+            stem = Path(filename).stem
+            for part in sorted(tmp_path.glob(f"{_HIVE_DIRS}/*.parquet")):
+                final_dir = parquet_path.parent / part.parent.relative_to(tmp_path)
+                final_dir.mkdir(parents=True, exist_ok=True)
+                final = final_dir / f"part-{stem}-{part.name}"
+                part.replace(final)
+                outputs.append(final)
         else:
-            df = (
-                pl.scan_csv(
-                    utf8_path,
-                    separator=";",
-                    has_header=False,
-                    new_columns=columns,
-                    infer_schema_length=0,
-                    truncate_ragged_lines=True,
-                    null_values=[""],
-                )
-                .collect()
-            )
+            tmp_path.replace(parquet_path)
+            outputs.append(parquet_path)
+    finally:
+        if tmp_path.is_dir():
+            shutil.rmtree(tmp_path)
+        tmp_path.unlink(missing_ok=True)
+        zip_path.unlink()
 
-        df.write_parquet(parquet_path, compression="snappy")
+    # Filtro de Bloom de CNPJ_BASICO ao lado de cada Parquet (ver bloom.py)
+    for output in outputs:
+        write_bloom(output)
 
-        # 6. Deleta CSV utf8
-        utf8_path.unlink()
+    if is_estabele:
+        retidos = pl.scan_parquet(outputs).select(pl.len()).collect().item() if outputs else 0
+        print(f"[FILT] Ativos retidos: {retidos:,}")
 
-    print(f"[DONE] {parquet_path.name}")
-    return parquet_path
+    if partition_keys:
+        print(f"[DONE] {filename} → {len(outputs):,} partes")
+    else:
+        print(f"[DONE] {parquet_path.name}")
+    return outputs
 
 
 # ---------------------------------------------------------------------------
-# Orquestração dos downloads com paralelismo controlado
+# Orquestração: downloads e conversões em estágios independentes
 # ---------------------------------------------------------------------------
 
 def download_all(
@@ -275,45 +782,154 @@ def download_all(
     file_type: str,
     dest_dir: Path,
     max_parallel: int = 2,
+    convert_mode: str = "stream",
+    download_workers: int | None = None,
+    convert_workers: int | None = None,
+    download_segments: int = 1,
+    manifest: Manifest | None = None,
+    sort_on_ingest: bool = False,
+    partition_on_ingest: bool = False,
 ) -> list[Path]:
     """
     Baixa e converte todos os ZIPs de um tipo para um mês.
 
-    max_parallel controla quantos arquivos são processados simultaneamente,
-    evitando esgotar o disco (cada ZIP pode ocupar ~1 GB).
+    Os dois estágios rodam em pools separados, ligados por uma fila limitada:
+      • download_workers threads baixam ZIPs (limitadas pela rede) e
+        colocam cada ZIP pronto na fila;
+      • convert_workers threads consomem a fila e convertem (limitadas pela
+        CPU), enquanto os próximos downloads já estão em andamento.
+    A fila comporta convert_workers ZIPs: quando a conversão fica para trás,
+    os downloaders esperam, limitando quantos ZIPs (~1 GB cada) ocupam o
+    disco ao mesmo tempo. Os dois valores usam max_parallel como padrão.
+
+    download_segments > 1 baixa cada ZIP grande por várias conexões em
+    paralelo (ver _download_segmented); o total de conexões simultâneas é
+    download_workers * download_segments.
+
+    Com um manifest, a listagem do mês vem do manifesto enquanto estiver
+    dentro do TTL (sem PROPFIND) e cada ZIP só é baixado se o Parquet
+    registrado para ele estiver ausente, truncado ou for de outra versão
+    (size/ETag) do arquivo remoto. Sem manifest, vale parquet_path.exists().
+
+    sort_on_ingest grava os Parquets ordenados e partition_on_ingest grava
+    ESTABELE particionado por UF/MUNICIPIO (ver _convert_zip). Com manifest,
+    Parquets gravados em outro layout são removidos e reconvertidos.
 
     Retorna lista de caminhos dos Parquets gerados.
     """
     if file_type not in FILE_TYPES:
         raise ValueError(f"file_type deve ser um de: {list(FILE_TYPES)}")
+    if convert_mode not in CONVERT_MODES:
+        raise ValueError(f"convert_mode deve ser um de: {list(CONVERT_MODES)}")
+
+    download_workers = download_workers or max_parallel
+    convert_workers  = convert_workers or max_parallel
+    configure_session(download_workers * max(download_segments, 1))
 
     dest_dir.mkdir(parents=True, exist_ok=True)
     columns = FILE_TYPES[file_type]
-    files = list_zip_files(month, file_type)
+    if partition_on_ingest and file_type == "ESTABELE":
+        layout = "hive"
+    else:
+        layout = "sorted" if sort_on_ingest else "flat"
+    if manifest is not None:
+        files = manifest.listing(
+            f"{month}/{file_type}", lambda: list_zip_files(month, file_type)
+        )
+    else:
+        files = list_zip_files(month, file_type)
 
     if not files:
         raise FileNotFoundError(
             f"Nenhum arquivo {file_type} encontrado para o mês {month}."
         )
 
-    print(f"[INFO] {len(files)} arquivo(s) {file_type} encontrado(s) para {month}.")
+    print(
+        f"[INFO] {len(files)} arquivo(s) {file_type} encontrado(s) para {month} "
+        f"({download_workers} download(s), {convert_workers} conversão(ões) simultâneos)."
+    )
 
     parquet_paths: list[Path] = []
     errors: list[str] = []
+    pending: list[dict] = []
+
+    for entry in files:
+        fn = entry["name"]
+        if manifest is not None:
+            done = manifest.is_current(dest_dir / f"{fn}.parquet", entry, layout)
+            # Remove o que houver do ZIP em qualquer layout antes de reconverter
+            stale = [] if done else (
+                _outputs_on_disk(dest_dir, fn, "flat") + _outputs_on_disk(dest_dir, fn, "hive")
+            )
+            if stale:
+                print(f"[STALE] {fn} — parquet desatualizado ou incompleto.")
+                for path in stale:
+                    path.unlink()
+                    bloom_path(path).unlink(missing_ok=True)
+        else:
+            done = bool(_outputs_on_disk(dest_dir, fn, layout))
+
+        if done:
+            print(f"[SKIP] {fn} — parquet já existe.")
+            parquet_paths.extend(_outputs_on_disk(dest_dir, fn, layout))
+        else:
+            pending.append(entry)
+
+    if not pending:
+        return parquet_paths
+
+    # Fila limitada entre os estágios; None sinaliza fim para cada conversor
+    ready: queue.Queue[tuple[dict, Path] | None] = queue.Queue(maxsize=convert_workers)
+
+    def _download(entry: dict) -> None:
+        fn = entry["name"]
+        zip_path = dest_dir / fn
+        _download_with_retry(
+            fn, entry["url"], zip_path, entry["size"] or None, entry["etag"],
+            segments=download_segments,
+        )
+        ready.put((entry, zip_path))  # bloqueia se a conversão estiver atrasada
+
+    def _convert_loop() -> None:
+        while (item := ready.get()) is not None:
+            entry, zip_path = item
+            fn = entry["name"]
+            try:
+                parquet_path = dest_dir / f"{fn}.parquet"
+                outputs = _convert_zip(
+                    fn, zip_path, parquet_path, columns, convert_mode,
+                    sort_on_ingest, partition_on_ingest,
+                )
+                if manifest is not None:
+                    manifest.record(
+                        parquet_path, entry, layout,
+                        parts=outputs if layout == "hive" else None,
+                    )
+                parquet_paths.extend(outputs)
+            except Exception as exc:
+                errors.append(fn)
+                print(f"[ERRO] {fn}: {exc}")
+
+    with (
+        ThreadPoolExecutor(max_workers=convert_workers) as convert_pool,
+        ThreadPoolExecutor(max_workers=download_workers) as download_pool,
+    ):
+        converters = [convert_pool.submit(_convert_loop) for _ in range(convert_workers)]
+        futures = {download_pool.submit(_download, e): e["name"] for e in pending}
 
-    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
-        futures = {
-            executor.submit(_process_one_zip, fn, url, dest_dir, columns): fn
-            for fn, url in files
-        }
         for future in as_completed(futures):
             fn = futures[future]
             try:
-                parquet_paths.append(future.result())
+                future.result()
             except Exception as exc:
                 errors.append(fn)
                 print(f"[ERRO] {fn}: {exc}")
 
+        for _ in converters:
+            ready.put(None)
+        for converter in converters:
+            converter.result()
+
     if errors:
         print(f"[WARN] {len(errors)} arquivo(s) falharam: {errors}")
 
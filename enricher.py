@@ -1,71 +1,284 @@
 # =============================================================================
 # enricher.py — Enriquecimento de Estabelecimentos com coordenadas geográficas.
 #
-# Estratégia em três etapas:
-#   1. Merge exato:      CEP + NUMERO (string)
-#   2. Merge aproximado: join_asof por número mais próximo dentro do mesmo CEP
+# Estratégia em três etapas (GEO_METHOD registra qual delas casou):
+#   1. Merge exato:      CEP + NUMERO
+#   2. Merge aproximado: número mais próximo dentro do mesmo CEP
 #   3. Nominatim:        fallback via API OpenStreetMap para os restantes
+# As etapas 1 e 2 são um único join_asof "nearest" ordenado por (CEP, número):
+# distância zero é o merge exato. GEO_NUM_DELTA guarda essa distância entre
+# os números; vizinhos além de GEO_MAX_NUM_DELTA (config.py) são recusados e
+# seguem para a etapa 3.
+#
+# As coordenadas são lidas via scan_parquet, só com as colunas usadas e com
+# o filtro de município empurrado para o leitor, padronizadas uma vez por
+# processo e guardadas por município num cache LRU por UF (CoordsCache),
+# limitado por COORDS_CACHE_MB. Se build_coords.py já gerou o store
+# padronizado da UF (coord_{UF}.store), ele é lido direto, sem limpeza.
+#
+# Os merges usam chaves inteiras: CEP e número (só dígitos) como Int32, nos
+# dois lados.
 # =============================================================================
 
+import json
 import time
+from collections import OrderedDict
 from pathlib import Path
 
 import polars as pl
 import requests
 
+from config import COORDS_CACHE_MB, COORDS_STORE_VERSION, GEO_MAX_NUM_DELTA
+from parquet_io import footer_digest
+
 
 # ---------------------------------------------------------------------------
 # Carregamento e preparação das coordenadas IBGE
 # ---------------------------------------------------------------------------
 
-def load_coords(
+COORDS_COLUMNS = ["COD_MUNICIPIO", "CEP", "NUM_ENDERECO", "LATITUDE", "LONGITUDE"]
+
+# Etapa que forneceu as coordenadas de cada estabelecimento (null: nenhuma)
+GEO_METHODS = ["EXATO", "APROXIMADO", "NOMINATIM"]
+GEO_METHOD_DTYPE = pl.Enum(GEO_METHODS)
+
+# Tabela padronizada (store e cache): pronta para os merges, sem limpeza
+COORDS_SCHEMA = {
+    "COD_MUNICIPIO": pl.Int32,
+    "CEP":           pl.Int32,
+    "NUM_ENDERECO":  pl.Int32,
+    "LATITUDE":      pl.Float32,
+    "LONGITUDE":     pl.Float32,
+}
+
+
+def coords_store_dir(uf: str, coords_dir: Path) -> Path:
+    """Diretório do store padronizado da UF (ver build_coords.py)."""
+    return coords_dir / f"coord_{uf.upper()}.store"
+
+
+def coords_store_meta(uf: str, coords_dir: Path) -> dict:
+    """
+    Metadados que identificam um store atualizado: versão do formato,
+    tamanho e rodapé (footer_digest) do coord_{UF}.parquet de origem (None
+    se a origem não estiver no diretório, caso em que qualquer store da
+    versão atual serve).
+    """
+    source = coords_dir / f"coord_{uf.upper()}.parquet"
+    if not source.exists():
+        return {"version": COORDS_STORE_VERSION, "source_size": None, "source_footer": None}
+    return {
+        "version": COORDS_STORE_VERSION,
+        "source_size": source.stat().st_size,
+        "source_footer": footer_digest(source),
+    }
+
+
+def coords_store_is_current(uf: str, coords_dir: Path) -> bool:
+    """True se coord_{UF}.store existe e corresponde ao coord_{UF}.parquet atual."""
+    meta_path = coords_store_dir(uf, coords_dir) / "meta.json"
+    if not meta_path.exists():
+        return False
+    meta = json.loads(meta_path.read_text())
+    atual = coords_store_meta(uf, coords_dir)
+    if meta.get("version") != atual["version"]:
+        return False
+    return atual["source_size"] is None or all(
+        meta.get(k) == atual[k] for k in ("source_size", "source_footer")
+    )
+
+
+def scan_raw_coords(
     uf: str,
     coords_dir: Path,
     ibge_codes: list[int] | None = None,
-) -> pl.DataFrame:
+) -> pl.LazyFrame:
     """
-    Carrega o arquivo coord_{UF}.parquet e filtra pelos municípios de interesse.
-    Padroniza CEP e NUM_ENDERECO para os merges.
-
-    Colunas esperadas no arquivo: COD_MUNICIPIO, CEP, NUM_ENDERECO, LATITUDE, LONGITUDE
+    LazyFrame do arquivo coord_{UF}.parquet, sem padronizar, só com as
+    colunas obrigatórias (COORDS_COLUMNS), que são validadas. Com
+    ibge_codes, o filtro por COD_MUNICIPIO vai para o leitor do Parquet:
+    num arquivo ordenado por município, os row groups dos demais
+    municípios não são descomprimidos.
     """
     path = coords_dir / f"coord_{uf.upper()}.parquet"
     if not path.exists():
         raise FileNotFoundError(f"Arquivo de coordenadas não encontrado: {path}")
 
-    df = pl.read_parquet(path)
+    lf = pl.scan_parquet(path)
 
     # Valida colunas obrigatórias
-    required = {"COD_MUNICIPIO", "CEP", "NUM_ENDERECO", "LATITUDE", "LONGITUDE"}
-    missing = required - set(df.columns)
+    schema = lf.collect_schema()
+    missing = set(COORDS_COLUMNS) - set(schema.names())
     if missing:
         raise ValueError(f"Colunas ausentes em {path.name}: {missing}")
+    lf = lf.select(COORDS_COLUMNS)
 
-    # Filtra municípios de interesse
     if ibge_codes:
-        df = df.filter(pl.col("COD_MUNICIPIO").cast(pl.Int64).is_in(ibge_codes))
+        # Compara no tipo gravado, para que as estatísticas sejam usadas
+        dtype = schema["COD_MUNICIPIO"]
+        if dtype.is_integer():
+            lf = lf.filter(pl.col("COD_MUNICIPIO").is_in(pl.Series(ibge_codes).cast(dtype).implode()))
+        else:
+            lf = lf.filter(pl.col("COD_MUNICIPIO").cast(pl.Int64, strict=False).is_in(ibge_codes))
+    return lf
 
-    # Padroniza e limpa
-    df = (
-        df
-        .with_columns([
-            pl.col("CEP").cast(pl.Utf8).str.replace_all(r"\D", "").str.zfill(8),
-            pl.col("NUM_ENDERECO").cast(pl.Utf8).str.replace_all(r"\D", ""),
-            pl.col("LATITUDE").cast(pl.Float64, strict=False),
-            pl.col("LONGITUDE").cast(pl.Float64, strict=False),
-        ])
-        .filter(
-            pl.col("NUM_ENDERECO").str.len_bytes() > 0,
-            pl.col("LATITUDE").is_not_null(),
-            pl.col("LONGITUDE").is_not_null(),
-        )
-        .unique(subset=["CEP", "NUM_ENDERECO"])
-        # Adiciona versão numérica do número para o merge aproximado
-        .with_columns(
-            pl.col("NUM_ENDERECO").cast(pl.Float64, strict=False).alias("_NUM_IBGE")
+
+def _to_int(col: pl.Expr) -> pl.Expr:
+    """Só os dígitos do valor, como Int32 (null se vazio ou grande demais)."""
+    return col.cast(pl.Utf8).str.replace_all(r"\D", "").cast(pl.Int32, strict=False)
+
+
+def normalize_coords(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Padroniza as coordenadas brutas para COORDS_SCHEMA: CEP e NUM_ENDERECO
+    só com dígitos, como inteiros; descarta pontos sem CEP, número ou
+    coordenadas e remove duplicados de CEP + número dentro de cada município.
+    """
+    return (
+        lf
+        .select(
+            pl.col("COD_MUNICIPIO").cast(pl.Int32, strict=False),
+            _to_int(pl.col("CEP")),
+            _to_int(pl.col("NUM_ENDERECO")),
+            pl.col("LATITUDE").cast(pl.Float32, strict=False),
+            pl.col("LONGITUDE").cast(pl.Float32, strict=False),
         )
+        .drop_nulls()
+        .unique(subset=["COD_MUNICIPIO", "CEP", "NUM_ENDERECO"])
     )
 
+
+def scan_coords(
+    uf: str,
+    coords_dir: Path,
+    ibge_codes: list[int] | None = None,
+) -> pl.LazyFrame:
+    """
+    Coordenadas padronizadas (COORDS_SCHEMA) da UF, opcionalmente só dos
+    municípios ibge_codes. Com um store atualizado (build_coords.py), lê
+    direto as partições dos municípios pedidos; senão, padroniza o
+    coord_{UF}.parquet nesta execução.
+    """
+    if not coords_store_is_current(uf, coords_dir):
+        if coords_store_dir(uf, coords_dir).exists():
+            print(f"[WARN] Store de coordenadas de UF={uf.upper()} desatualizado; "
+                  "rode build_coords.py novamente.")
+        return normalize_coords(scan_raw_coords(uf, coords_dir, ibge_codes))
+
+    store = coords_store_dir(uf, coords_dir)
+    if ibge_codes:
+        files = [f for cod in ibge_codes for f in sorted(store.glob(f"COD_MUNICIPIO={cod}/*.parquet"))]
+    else:
+        files = sorted(store.glob("COD_MUNICIPIO=*/*.parquet"))
+    if not files:
+        return pl.LazyFrame(schema=COORDS_SCHEMA)
+    return pl.scan_parquet(files, hive_partitioning=False).select(list(COORDS_SCHEMA))
+
+
+class CoordsCache:
+    """
+    Coordenadas padronizadas por UF e município, com despejo LRU por UF
+    quando o total passa de max_mb (a UF mais recente é sempre mantida).
+    Só os municípios pedidos são lidos do disco (scan_coords); uma UF
+    inteira só é lida quando pedida sem municípios.
+    """
+
+    def __init__(self, max_mb: int = COORDS_CACHE_MB):
+        self.max_mb = max_mb
+        # (UF, coords_dir) → {"munis": {COD_MUNICIPIO: DataFrame},
+        #                     "completa": bool, "vazia": DataFrame sem linhas}
+        self._ufs: OrderedDict[tuple[str, Path], dict] = OrderedDict()
+
+    def _size_mb(self) -> float:
+        return sum(
+            df.estimated_size("mb")
+            for entry in self._ufs.values()
+            for df in entry["munis"].values()
+        )
+
+    def get(
+        self,
+        uf: str,
+        coords_dir: Path,
+        ibge_codes: list[int] | None = None,
+    ) -> list[pl.DataFrame]:
+        """
+        Coordenadas padronizadas dos municípios pedidos (sem ibge_codes, de
+        todos), uma tabela por município, lendo do disco só os que faltam.
+        """
+        key = (uf.upper(), Path(coords_dir))
+        entry = self._ufs.setdefault(key, {"munis": {}, "completa": False})
+        self._ufs.move_to_end(key)
+        munis = entry["munis"]
+
+        if ibge_codes:
+            faltam = [] if entry["completa"] else [c for c in ibge_codes if c not in munis]
+        else:
+            faltam = None if not entry["completa"] else []
+
+        if faltam is None or faltam:
+            try:
+                df = scan_coords(uf, coords_dir, faltam).collect()
+            except FileNotFoundError:
+                del self._ufs[key]
+                raise
+            entry["vazia"] = df.clear()
+            munis.update(
+                (cod, part) for (cod,), part in df.partition_by("COD_MUNICIPIO", as_dict=True).items()
+            )
+            # Municípios sem pontos também ficam registrados (tabela vazia)
+            for cod in faltam or []:
+                munis.setdefault(cod, entry["vazia"])
+            entry["completa"] = faltam is None
+            self._evict()
+            print(
+                f"[IBGE] UF={key[0]}: {len(df):,} pontos de coordenadas em cache "
+                f"({'todos os municípios' if faltam is None else f'{len(faltam)} município(s)'}, "
+                f"{self._size_mb():,.0f} MB)"
+            )
+
+        if not ibge_codes:
+            return list(munis.values()) or [entry["vazia"]]
+        return [munis.get(cod, entry["vazia"]) for cod in ibge_codes]
+
+    def _evict(self) -> None:
+        while len(self._ufs) > 1 and self._size_mb() > self.max_mb:
+            (uf_old, _), _ = self._ufs.popitem(last=False)
+            print(f"[IBGE] Coordenadas de UF={uf_old} removidas do cache")
+
+
+_cache = CoordsCache()
+
+
+def configure_coords_cache(max_mb: int = COORDS_CACHE_MB) -> None:
+    """Define o limite de memória do cache de coordenadas do processo."""
+    _cache.max_mb = max_mb
+
+
+def preload_coords(uf: str, coords_dir: Path, ibge_codes: list[int]) -> None:
+    """
+    Lê numa só passada as coordenadas de vários municípios da UF para o
+    cache, antes de enriquecê-los um a um com load_coords.
+    """
+    _cache.get(uf, coords_dir, ibge_codes)
+
+
+def load_coords(
+    uf: str,
+    coords_dir: Path,
+    ibge_codes: list[int] | None = None,
+) -> pl.DataFrame:
+    """
+    Coordenadas padronizadas (CEP e NUM_ENDERECO) dos municípios de
+    interesse, prontas para os merges. Cada município é lido do disco só
+    na primeira vez; depois vem do cache (CoordsCache).
+    """
+    partes = _cache.get(uf, coords_dir, ibge_codes)
+    df = partes[0]
+    if len(partes) > 1:
+        # CEP + número só são únicos dentro de cada município
+        df = pl.concat(partes).unique(subset=["CEP", "NUM_ENDERECO"])
+
     print(
         f"[IBGE] {len(df):,} registros de coordenadas carregados "
         f"(UF={uf.upper()}, municípios={ibge_codes or 'todos'})"
@@ -77,125 +290,124 @@ def load_coords(
 # Preparação do DataFrame de Estabelecimentos
 # ---------------------------------------------------------------------------
 
-def _prepare_estab(df: pl.DataFrame) -> pl.DataFrame:
+def _standardize() -> list[pl.Expr]:
     """
-    Padroniza CEP, NUMERO e monta CNPJ completo.
-    Inicializa colunas LATITUDE e LONGITUDE como nulas.
+    Padronização comum a todo output de estabelecimentos, enriquecido ou
+    não: CEP e NUMERO só com dígitos, chave CNPJ (Int64) como texto de 14
+    dígitos e LATITUDE/LONGITUDE nulas.
     """
-    return df.with_columns([
+    return [
         pl.col("CEP").str.replace_all(r"\D", "").str.zfill(8),
         pl.col("NUMERO").str.replace_all(r"\D", "").alias("NUMERO"),
-        (
-            pl.col("CNPJ_BASICO").str.zfill(8)
-            + pl.col("CNPJ_ORDEM").str.zfill(4)
-            + pl.col("CNPJ_DV").str.zfill(2)
-        ).alias("CNPJ"),
+        pl.col("CNPJ").cast(pl.Utf8).str.zfill(14).alias("CNPJ"),
         pl.lit(None).cast(pl.Float64).alias("LATITUDE"),
         pl.lit(None).cast(pl.Float64).alias("LONGITUDE"),
-    ])
-
+    ]
 
-# ---------------------------------------------------------------------------
-# Etapa 1 — Merge exato (CEP + NUMERO)
-# ---------------------------------------------------------------------------
 
-def _enrich_exact(df: pl.DataFrame, df_coords: pl.DataFrame) -> pl.DataFrame:
-    """Preenche coordenadas por correspondência exata de CEP e número."""
-    coords = df_coords.select([
-        pl.col("CEP"),
-        pl.col("NUM_ENDERECO"),
-        pl.col("LATITUDE").alias("_LAT"),
-        pl.col("LONGITUDE").alias("_LON"),
+def _prepare_estab(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Padroniza o DataFrame (_standardize) e cria as chaves inteiras dos
+    merges (_CEP, _NUM), no formato de COORDS_SCHEMA.
+    """
+    return df.with_columns([
+        *_standardize(),
+        _to_int(pl.col("CEP")).alias("_CEP"),
+        _to_int(pl.col("NUMERO")).alias("_NUM"),
     ])
 
-    merged = df.join(
-        coords,
-        left_on=["CEP", "NUMERO"],
-        right_on=["CEP", "NUM_ENDERECO"],
-        how="left",
-    ).with_columns([
-        pl.when(pl.col("LATITUDE").is_null())
-          .then(pl.col("_LAT"))
-          .otherwise(pl.col("LATITUDE"))
-          .alias("LATITUDE"),
-        pl.when(pl.col("LONGITUDE").is_null())
-          .then(pl.col("_LON"))
-          .otherwise(pl.col("LONGITUDE"))
-          .alias("LONGITUDE"),
-    ]).drop(["_LAT", "_LON"])
-
-    matched = merged["LATITUDE"].is_not_null().sum()
-    print(f"[IBGE] Merge exato:      {matched:,} coordenadas obtidas")
-    return merged
+
+def without_coords(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Estabelecimentos que não passam pelo enriquecimento (UF sem arquivo de
+    coordenadas, exterior), com o mesmo schema da saída de enrich() e as
+    colunas de coordenadas nulas.
+    """
+    return df.with_columns([
+        *_standardize(),
+        pl.lit(None, dtype=GEO_METHOD_DTYPE).alias("GEO_METHOD"),
+        pl.lit(None, dtype=pl.Int32).alias("GEO_NUM_DELTA"),
+    ])
 
 
 # ---------------------------------------------------------------------------
-# Etapa 2 — Merge aproximado via join_asof (número mais próximo no CEP)
+# Etapas 1 e 2 — Merge exato ou número mais próximo no CEP (join_asof)
 # ---------------------------------------------------------------------------
 
-def _enrich_approximate(df: pl.DataFrame, df_coords: pl.DataFrame) -> pl.DataFrame:
+def _enrich_cep_numero(
+    df: pl.DataFrame,
+    df_coords: pl.DataFrame,
+    max_num_delta: int | None = GEO_MAX_NUM_DELTA,
+) -> pl.DataFrame:
     """
-    Para registros ainda sem coordenadas, busca o número mais próximo
-    dentro do mesmo CEP usando join_asof do Polars (O(n log n)).
+    Preenche coordenadas num único merge ordenado por (CEP, número): o
+    join_asof "nearest" dentro do mesmo CEP encontra o próprio número
+    quando ele existe nas coordenadas (merge exato) e, senão, o número
+    mais próximo (merge aproximado). GEO_METHOD registra qual dos dois
+    casou e GEO_NUM_DELTA a distância entre os números (0 no exato);
+    registros sem CEP ou número ficam sem coordenadas.
+
+    Com max_num_delta, vizinhos a mais do que isso não são aceitos (a
+    tolerância do join_asof): o registro fica sem coordenadas e pode ir
+    para o Nominatim.
+
+    Só as chaves (e a posição de cada linha) são ordenadas; o resultado
+    volta às linhas de df pela posição, sem reordenar o DataFrame inteiro.
     """
-    original_cols = df.columns  # preserva schema original
-
-    coords_asof = (
+    coords = (
         df_coords
-        .filter(pl.col("_NUM_IBGE").is_not_null())
         .select([
-            pl.col("CEP").alias("_RCEP"),
-            pl.col("_NUM_IBGE"),
+            pl.col("CEP").alias("_CEP"),
+            pl.col("NUM_ENDERECO").alias("_NUM_IBGE"),
             pl.col("LATITUDE").alias("_LAT"),
             pl.col("LONGITUDE").alias("_LON"),
         ])
-        .sort(["_RCEP", "_NUM_IBGE"])
+        .sort(["_CEP", "_NUM_IBGE"])
     )
 
-    # Adiciona versão numérica do NUMERO para comparação
-    df = df.with_columns(
-        pl.col("NUMERO").cast(pl.Float64, strict=False).alias("_NUM_EST")
-    )
-
-    # Separa registros com número válido dos sem número
-    df_with_num = df.filter(pl.col("_NUM_EST").is_not_null()).sort(["CEP", "_NUM_EST"])
-    df_no_num   = df.filter(pl.col("_NUM_EST").is_null()).drop("_NUM_EST")
-
-    if df_with_num.is_empty():
-        return df.drop("_NUM_EST")
-
-    df_joined = (
-        df_with_num
+    matches = (
+        df.select(pl.int_range(pl.len(), dtype=pl.UInt32).alias("_ROW"), "_CEP", "_NUM")
+        .sort(["_CEP", "_NUM"], nulls_last=True)
         .join_asof(
-            coords_asof,
-            left_on="_NUM_EST",
+            coords,
+            left_on="_NUM",
             right_on="_NUM_IBGE",
-            by_left="CEP",
-            by_right="_RCEP",
+            by="_CEP",
             strategy="nearest",
+            tolerance=max_num_delta,
+            check_sortedness=False,  # os dois lados acabaram de ser ordenados
         )
-        .with_columns([
-            pl.when(pl.col("LATITUDE").is_null())
-              .then(pl.col("_LAT"))
-              .otherwise(pl.col("LATITUDE"))
-              .alias("LATITUDE"),
-            pl.when(pl.col("LONGITUDE").is_null())
-              .then(pl.col("_LON"))
-              .otherwise(pl.col("LONGITUDE"))
-              .alias("LONGITUDE"),
+        .sort("_ROW")
+        .with_columns(
+            (pl.col("_NUM_IBGE") - pl.col("_NUM")).abs().alias("GEO_NUM_DELTA")
+        )
+        .select([
+            pl.col("_LAT").cast(pl.Float64),
+            pl.col("_LON").cast(pl.Float64),
+            pl.when(pl.col("_LAT").is_null())
+              .then(None)
+              .when(pl.col("GEO_NUM_DELTA") == 0)
+              .then(pl.lit("EXATO"))
+              .otherwise(pl.lit("APROXIMADO"))
+              .cast(GEO_METHOD_DTYPE)
+              .alias("GEO_METHOD"),
+            pl.col("GEO_NUM_DELTA"),
         ])
-        # Retorna ao schema original (descarta colunas temporárias do join)
-        .select(original_cols)
     )
 
-    result = pl.concat(
-        [df_joined, df_no_num.select(original_cols)],
-        how="vertical",
+    merged = (
+        df.hstack(matches)
+        .with_columns([
+            pl.coalesce("LATITUDE", "_LAT").alias("LATITUDE"),
+            pl.coalesce("LONGITUDE", "_LON").alias("LONGITUDE"),
+        ])
+        .drop(["_LAT", "_LON"])
     )
 
-    matched = result["LATITUDE"].is_not_null().sum()
-    print(f"[IBGE] Merge aproximado: {matched:,} coordenadas acumuladas")
-    return result
+    exatos = (merged["GEO_METHOD"] == "EXATO").sum()
+    print(f"[IBGE] Merge exato:      {exatos:,} coordenadas obtidas")
+    print(f"[IBGE] Merge aproximado: {merged['LATITUDE'].is_not_null().sum():,} coordenadas acumuladas")
+    return merged
 
 
 # ---------------------------------------------------------------------------
@@ -272,7 +484,12 @@ def _enrich_nominatim(df: pl.DataFrame, rate_limit: float = 1.1) -> pl.DataFrame
     df_without = df_without.with_columns([
         pl.Series("LATITUDE",  lats,  dtype=pl.Float64),
         pl.Series("LONGITUDE", lons, dtype=pl.Float64),
-    ])
+    ]).with_columns(
+        pl.when(pl.col("LATITUDE").is_not_null())
+          .then(pl.lit("NOMINATIM"))
+          .cast(GEO_METHOD_DTYPE)
+          .alias("GEO_METHOD")
+    )
 
     result = pl.concat([df_with, df_without], how="vertical")
     matched = result["LATITUDE"].is_not_null().sum()
@@ -290,15 +507,16 @@ def enrich(
     coords_dir: Path,
     ibge_codes: list[int] | None = None,
     use_nominatim: bool = False,
+    max_num_delta: int | None = GEO_MAX_NUM_DELTA,
 ) -> pl.DataFrame:
     """
     Pipeline completo de enriquecimento de estabelecimentos com coordenadas.
 
     Etapas:
       1. Padroniza o DataFrame (CEP, NUMERO, CNPJ)
-      2. Merge exato por CEP + NUMERO
-      3. Merge aproximado por CEP + número mais próximo
-      4. Nominatim (opcional) para os restantes sem coordenadas
+      2. Merge exato por CEP + NUMERO ou, se não houver, pelo número mais
+         próximo no mesmo CEP — num único join_asof
+      3. Nominatim (opcional) para os restantes sem coordenadas
 
     Args:
         df:           DataFrame de estabelecimentos (colunas padrão ESTABELE)
@@ -306,8 +524,12 @@ def enrich(
         coords_dir:   Diretório onde estão os arquivos de coordenadas
         ibge_codes:   Filtra o arquivo de coords por municípios específicos
         use_nominatim: Habilita o fallback via API Nominatim
+        max_num_delta: Maior distância entre números aceita no merge
+                      aproximado (None: sem limite)
 
-    Retorna DataFrame com colunas CNPJ, LATITUDE, LONGITUDE adicionadas.
+    Retorna DataFrame com CNPJ formatado (14 dígitos) e colunas LATITUDE,
+    LONGITUDE, GEO_METHOD (etapa que casou: ver GEO_METHODS) e
+    GEO_NUM_DELTA (distância entre os números no merge por CEP) adicionadas.
     """
     df_coords = load_coords(uf, coords_dir, ibge_codes)
     df = _prepare_estab(df)
@@ -315,12 +537,13 @@ def enrich(
     total = len(df)
     print(f"[ENRI] {total:,} estabelecimentos para enriquecer")
 
-    df = _enrich_exact(df, df_coords)
-    df = _enrich_approximate(df, df_coords)
+    df = _enrich_cep_numero(df, df_coords, max_num_delta)
 
     if use_nominatim:
         df = _enrich_nominatim(df)
 
+    df = df.drop(["_CEP", "_NUM"])
+
     with_coords = df["LATITUDE"].is_not_null().sum()
     pct = with_coords / total * 100 if total else 0
     print(f"[ENRI] Resultado: {with_coords:,}/{total:,} ({pct:.1f}%) com coordenadas")
@@ -6,17 +6,44 @@
 #   • filter_cnpj_estab    → Parquet de estabelecimentos filtrados por CNPJ
 #   • filter_cnpj_empresa  → Parquet de empresas filtradas por CNPJ_BASICO
 #
-# IMPORTANTE: todos os filtros processam um arquivo Parquet por vez para
-# evitar OOM no runner do GitHub Actions (7 GB de RAM). O LazyFrame global
-# (scan_parquet com wildcard) foi substituído por um loop explícito que lê,
-# filtra e libera cada arquivo individualmente.
+# IMPORTANTE: os filtros por CNPJ não usam um LazyFrame global (scan_parquet
+# com wildcard), para evitar OOM no runner do GitHub Actions (7 GB de RAM).
+# Cada arquivo é lido, filtrado e liberado individualmente, até K arquivos
+# ao mesmo tempo, com K limitado por um orçamento de memória (_scan_workers);
+# os resultados vão para o disco assim que ficam prontos. O filtro por
+# município lê tudo numa passada só, mas em streaming direto para os arquivos
+# de saída, sem materializar os resultados em memória.
+#
+# Com o índice de CNPJ (cnpj_index.py), filter_cnpj_estab lê só os row
+# groups que contêm os CNPJs pedidos, sem varrer os arquivos. Sem ele, os
+# filtros por CNPJ pulam os arquivos cujo filtro de Bloom (bloom.py) não
+# contém nenhum dos CNPJ_BASICO pedidos.
+#
+# Se ESTABELE foi ingerido particionado (--partition-on-ingest, layout
+# UF=../MUNICIPIO=../part-*.parquet), o filtro por município só lê os
+# diretórios dos municípios pedidos e os demais filtros leem uma UF por vez.
 # =============================================================================
 
+import os
+import shutil
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import polars as pl
 
-from config import SIAFI_MAP_PATH
+import bloom
+import cnpj_index
+from config import (
+    BLOOM_MAX_KEYS,
+    CNPJ_INDEX_MAX_KEYS,
+    CNPJ_SEMI_JOIN_MIN_KEYS,
+    CNPJ_SORT_MERGE_MIN_KEYS,
+    FILTER_MEMORY_MB,
+    FILTER_SCAN_EXPANSION,
+    SIAFI_MAP_PATH,
+)
+from parquet_io import ParquetPartsWriter, sink_parquet
 
 
 # ---------------------------------------------------------------------------
@@ -44,29 +71,42 @@ def ibge_to_info(ibge_codes: list[int], df_map: pl.DataFrame) -> dict[int, dict]
 
     Retorna: {ibge: {"siafi": int, "nome": str, "uf": str}}
     """
+    rows = {r["IBGE"]: r for r in df_map.iter_rows(named=True)}
     result = {}
     for ibge in ibge_codes:
-        row = df_map.filter(pl.col("IBGE") == ibge)
-        if row.is_empty():
+        r = rows.get(ibge)
+        if r is None:
             raise ValueError(
                 f"Código IBGE {ibge} não encontrado na tabela de mapeamento."
             )
-        r = row.row(0, named=True)
         result[ibge] = {
             "siafi": r["SIAFI"],
-            "nome": r["MUNICIPIO_NOME"],
+            "nome": r["MUNICIPIO_NOME"] or str(ibge),  # há linhas sem nome
             "uf": r["UF"],
         }
     return result
 
 
-def siafi_to_ibge(siafi_codes: list[str], df_map: pl.DataFrame) -> list[int]:
+def all_municipios(df_map: pl.DataFrame, uf: str | None = None) -> list[int]:
+    """
+    Códigos IBGE de todos os municípios da UF informada, ou do país inteiro
+    se uf for None. Usado por --municipios all. A linha do exterior
+    (UF=EX, IBGE 0) não é um município e fica de fora.
+    """
+    df_map = df_map.filter(pl.col("IBGE") > 0, pl.col("UF") != "EX")
+    if uf:
+        df_map = df_map.filter(pl.col("UF") == uf.upper())
+        if df_map.is_empty():
+            raise ValueError(f"UF {uf} não encontrada na tabela de mapeamento.")
+    return sorted(df_map["IBGE"].to_list())
+
+
+def siafi_to_ibge(siafi_codes: list[int], df_map: pl.DataFrame) -> list[int]:
     """
-    Converte lista de códigos SIAFI (string) em lista de códigos IBGE (int).
+    Converte lista de códigos SIAFI em lista de códigos IBGE.
     Usado internamente para determinar quais municípios buscar no arquivo de coords.
     """
-    df_map_str = df_map.with_columns(pl.col("SIAFI").cast(pl.Utf8))
-    filtered = df_map_str.filter(pl.col("SIAFI").is_in(siafi_codes))
+    filtered = df_map.filter(pl.col("SIAFI").is_in(siafi_codes))
     return filtered["IBGE"].to_list()
 
 
@@ -74,14 +114,149 @@ def siafi_to_ibge(siafi_codes: list[str], df_map: pl.DataFrame) -> list[int]:
 # Utilidade interna
 # ---------------------------------------------------------------------------
 
-def _list_parquet_files(parquet_dir: Path) -> list[Path]:
-    """Retorna lista de arquivos .parquet em um diretório. Lança erro se vazio."""
-    files = sorted(parquet_dir.glob("*.parquet"))
-    if not files:
+def _is_hive(parquet_dir: Path) -> bool:
+    """True se o diretório está no layout UF=../MUNICIPIO=../part-*.parquet."""
+    return not any(parquet_dir.glob("*.parquet")) and any(parquet_dir.glob("UF=*"))
+
+
+def _list_parquet_groups(parquet_dir: Path) -> list[tuple[str, list[Path]]]:
+    """
+    Retorna os grupos de arquivos .parquet lidos juntos pelos filtros:
+    um por arquivo no layout plano, uma UF por grupo no layout hive.
+    Lança erro se não houver nenhum arquivo.
+    """
+    if _is_hive(parquet_dir):
+        groups = [
+            (uf_dir.name, sorted(uf_dir.glob("MUNICIPIO=*/*.parquet")))
+            for uf_dir in sorted(parquet_dir.glob("UF=*"))
+        ]
+        groups = [(nome, files) for nome, files in groups if files]
+    else:
+        groups = [(f.name, [f]) for f in sorted(parquet_dir.glob("*.parquet"))]
+
+    if not groups:
         raise FileNotFoundError(
             f"Nenhum arquivo .parquet encontrado em: {parquet_dir}"
         )
-    return files
+    return groups
+
+
+def _scan_workers(
+    groups: list[tuple[str, list[Path]]],
+    workers: int | None,
+    memory_mb: int,
+) -> int:
+    """
+    Quantos grupos escanear ao mesmo tempo: no máximo `workers` (padrão:
+    número de CPUs) e no máximo quantos scans do maior grupo cabem em
+    memory_mb, estimando cada um como FILTER_SCAN_EXPANSION × tamanho em disco.
+    """
+    maior = max((sum(f.stat().st_size for f in files) for _, files in groups), default=0)
+    cabem = memory_mb * 1024 * 1024 // max(maior * FILTER_SCAN_EXPANSION, 1)
+    return max(1, min(workers or os.cpu_count() or 1, cabem, len(groups)))
+
+
+def _prune_by_bloom(
+    groups: list[tuple[str, list[Path]]],
+    basicos: pl.Series,
+) -> list[tuple[str, list[Path]]]:
+    """
+    Remove dos grupos os arquivos cujo filtro de Bloom garante que nenhum
+    dos `basicos` (CNPJ_BASICO) está presente. Com mais de BLOOM_MAX_KEYS
+    chaves os filtros não são consultados.
+    """
+    if len(basicos) > BLOOM_MAX_KEYS:
+        return groups
+    total = sum(len(files) for _, files in groups)
+    groups = [
+        (nome, [f for f in files if bloom.might_contain(f, basicos)])
+        for nome, files in groups
+    ]
+    groups = [(nome, files) for nome, files in groups if files]
+    restantes = sum(len(files) for _, files in groups)
+    if restantes < total:
+        print(f"[BLOM] {total - restantes} de {total} arquivo(s) pulado(s) pelo filtro de Bloom")
+    return groups
+
+
+def _key_strategy(n_keys: int) -> str:
+    """Estratégia de casamento para uma lista de n_keys chaves (ver config)."""
+    if CNPJ_SORT_MERGE_MIN_KEYS is not None and n_keys >= CNPJ_SORT_MERGE_MIN_KEYS:
+        return "merge"
+    if n_keys >= CNPJ_SEMI_JOIN_MIN_KEYS:
+        return "semi"
+    return "is_in"
+
+
+def _match_keys(
+    column: str,
+    keys: pl.Series,
+    strategy: str | None = None,
+) -> Callable[[pl.LazyFrame], pl.LazyFrame]:
+    """
+    Retorna a consulta que mantém as linhas cujo `column` está em `keys`
+    (chaves únicas, do mesmo tipo da coluna). A lista é preparada uma só
+    vez e compartilhada por todos os arquivos:
+      is_in — filtro com a lista como literal; poda row groups pelas
+              estatísticas min/max
+      semi  — semi-join com a lista como DataFrame tipado (tabela hash)
+      merge — ordena cada arquivo pela chave e faz join com a lista
+              ordenada (sort-merge); a saída sai na ordem da chave
+    """
+    strategy = strategy or _key_strategy(len(keys))
+    if strategy == "is_in":
+        predicate = pl.col(column).is_in(keys.implode())
+        return lambda lf: lf.filter(predicate)
+
+    if strategy == "semi":
+        df_keys = keys.rename(column).to_frame().lazy()
+        return lambda lf: lf.join(df_keys, on=column, how="semi")
+
+    if strategy == "merge":
+        df_keys = keys.rename(column).sort().to_frame().lazy().set_sorted(column)
+        return lambda lf: lf.sort(column).join(df_keys, on=column, how="inner")
+
+    raise ValueError(f"Estratégia desconhecida: {strategy}")
+
+
+def _scan_filter(
+    groups: list[tuple[str, list[Path]]],
+    query: Callable[[pl.LazyFrame], pl.LazyFrame],
+    output_path: Path,
+    workers: int | None,
+    memory_mb: int,
+) -> int:
+    """
+    Executor compartilhado pelos filtros por CNPJ: aplica `query` a
+    cada grupo, com até _scan_workers() grupos em paralelo, e grava cada
+    resultado no disco assim que fica pronto (ParquetPartsWriter). O pico de
+    RAM fica limitado aos scans em andamento. Retorna o total de linhas.
+    """
+    k = _scan_workers(groups, workers, memory_mb)
+    print(f"[FILT] {len(groups)} arquivo(s)/grupo(s), {k} escaneado(s) em paralelo")
+
+    def scan(index: int, nome: str, files: list[Path]) -> None:
+        print(f"[FILT] Escaneando {nome}...")
+        df = query(pl.scan_parquet(files, hive_partitioning=False)).collect()
+        if len(df) > 0:
+            writer.write(df, index)
+            print(f"[FILT] → {len(df):,} matches em {nome}")
+
+    with (
+        ParquetPartsWriter(output_path) as writer,
+        ThreadPoolExecutor(max_workers=k) as pool,
+    ):
+        futures = [
+            pool.submit(scan, i, nome, files) for i, (nome, files) in enumerate(groups)
+        ]
+        for future in as_completed(futures):
+            future.result()
+    return writer.rows
+
+
+def _municipio_output_path(output_dir: Path, ibge: int, info: dict) -> Path:
+    nome_safe = info["nome"].replace(" ", "_").replace("/", "-")
+    return output_dir / f"ESTAB_{nome_safe}_{ibge}.parquet"
 
 
 # ---------------------------------------------------------------------------
@@ -92,132 +267,192 @@ def filter_by_municipio(
     parquet_dir: Path,
     ibge_info: dict[int, dict],
     output_dir: Path,
+    workers: int | None = None,
+    memory_mb: int = FILTER_MEMORY_MB,
 ) -> dict[int, Path]:
     """
     Filtra os Parquets de ESTABELE por código SIAFI do município.
-    Processa um arquivo por vez para controlar o uso de memória.
     Gera um arquivo de saída independente por município.
 
+    Todos os arquivos são lidos numa única passada em streaming: as linhas
+    dos municípios pedidos são repartidas por MUNICIPIO (pl.PartitionBy),
+    cada município com seu próprio writer incremental. O custo não cresce
+    com o número de municípios e a memória não acumula resultados parciais.
+    No layout hive, lê apenas os diretórios MUNICIPIO=<siafi> pedidos,
+    vários municípios em paralelo (ver _scan_workers).
+
     Args:
         parquet_dir: Diretório com os Parquets de ESTABELE
         ibge_info:   Dicionário retornado por ibge_to_info()
         output_dir:  Diretório de saída
+        workers:     Máximo de municípios lidos em paralelo no layout hive
+        memory_mb:   Orçamento de memória dos scans paralelos
 
     Retorna: {ibge_code: path_do_parquet_filtrado}
     """
     output_dir.mkdir(parents=True, exist_ok=True)
-    files = _list_parquet_files(parquet_dir)
-
-    # Prepara acumuladores por município
-    siafi_to_ibge_local = {
-        str(info["siafi"]): ibge for ibge, info in ibge_info.items()
-    }
-    acumuladores: dict[int, list[pl.DataFrame]] = {ibge: [] for ibge in ibge_info}
-
-    for f in files:
-        print(f"[FILT] Escaneando {f.name}...")
-        df = (
-            pl.scan_parquet(str(f))
-            .filter(pl.col("MUNICIPIO").is_in(list(siafi_to_ibge_local.keys())))
-            .collect()
+    if _is_hive(parquet_dir):
+        return _filter_by_municipio_hive(
+            parquet_dir, ibge_info, output_dir, workers, memory_mb
         )
-        if df.is_empty():
-            continue
 
-        # Distribui as linhas para cada município encontrado
-        for siafi_str, ibge in siafi_to_ibge_local.items():
-            parte = df.filter(pl.col("MUNICIPIO") == siafi_str)
-            if len(parte) > 0:
-                acumuladores[ibge].append(parte)
+    files = [f for _, group in _list_parquet_groups(parquet_dir) for f in group]
+    # MUNICIPIO é o código SIAFI (Int32)
+    siafis = [info["siafi"] for info in ibge_info.values()]
 
+    # Uma parte por município em tmp_dir/MUNICIPIO=<siafi>/; sem limite de
+    # tamanho por arquivo, cada município gera exatamente um arquivo.
+    tmp_dir = output_dir / "_municipios.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"[FILT] Escaneando {len(files)} arquivo(s) em uma passada...")
     outputs: dict[int, Path] = {}
-    for ibge, info in ibge_info.items():
-        partes = acumuladores[ibge]
-        nome_safe = info["nome"].replace(" ", "_").replace("/", "-")
-        out_path = output_dir / f"ESTAB_{nome_safe}_{ibge}.parquet"
+    try:
+        sink_parquet(
+            pl.scan_parquet(files, hive_partitioning=False)
+            .filter(pl.col("MUNICIPIO").is_in(siafis)),
+            pl.PartitionBy(
+                tmp_dir, key="MUNICIPIO", include_key=True,
+                approximate_bytes_per_file=None,
+            ),
+        )
 
-        if not partes:
-            print(f"[WARN] Nenhum registro encontrado para {info['nome']}.")
-            continue
+        for ibge, info in ibge_info.items():
+            partes = sorted(tmp_dir.glob(f"MUNICIPIO={info['siafi']}/*.parquet"))
+            if not partes:
+                print(f"[WARN] Nenhum registro encontrado para {info['nome']}.")
+                continue
 
-        df_final = pl.concat(partes, how="diagonal")
-        df_final.write_parquet(out_path, compression="snappy")
-        print(f"[SAVE] {out_path.name} — {len(df_final):,} registros")
-        outputs[ibge] = out_path
+            out_path = _municipio_output_path(output_dir, ibge, info)
+            partes[0].replace(out_path)
+            n = pl.scan_parquet(out_path).select(pl.len()).collect().item()
+            print(f"[SAVE] {out_path.name} — {n:,} registros")
+            outputs[ibge] = out_path
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
     return outputs
 
 
+def _filter_by_municipio_hive(
+    parquet_dir: Path,
+    ibge_info: dict[int, dict],
+    output_dir: Path,
+    workers: int | None,
+    memory_mb: int,
+) -> dict[int, Path]:
+    """filter_by_municipio para o layout hive: cada município é um diretório."""
+    pedidos: list[tuple[int, list[Path]]] = []
+    for ibge, info in ibge_info.items():
+        files = sorted(parquet_dir.glob(f"UF=*/MUNICIPIO={info['siafi']}/*.parquet"))
+        if files:
+            pedidos.append((ibge, files))
+        else:
+            print(f"[WARN] Nenhum registro encontrado para {info['nome']}.")
+    if not pedidos:
+        return {}
+
+    def extract(ibge: int, files: list[Path]) -> Path:
+        out_path = _municipio_output_path(output_dir, ibge, ibge_info[ibge])
+        sink_parquet(pl.scan_parquet(files, hive_partitioning=False), out_path)
+        n = pl.scan_parquet(out_path).select(pl.len()).collect().item()
+        print(f"[SAVE] {out_path.name} — {n:,} registros ({len(files)} parte(s))")
+        return out_path
+
+    k = _scan_workers([(str(ibge), files) for ibge, files in pedidos], workers, memory_mb)
+    with ThreadPoolExecutor(max_workers=k) as pool:
+        futures = {pool.submit(extract, ibge, files): ibge for ibge, files in pedidos}
+        done = {futures[f]: f.result() for f in as_completed(futures)}
+
+    # Mantém a ordem de ibge_info
+    return {ibge: done[ibge] for ibge, _ in pedidos}
+
+
 # ---------------------------------------------------------------------------
 # Filtro de Estabelecimentos por CNPJ
 # ---------------------------------------------------------------------------
 
-def load_cnpjs_from_xlsx(path: str) -> set[str]:
+def cnpj_index_dir(parquet_dir: Path) -> Path:
+    """Diretório do índice de CNPJ de um diretório de ESTABELE."""
+    return parquet_dir.with_name(f"{parquet_dir.name}.cnpjidx")
+
+
+def ensure_cnpj_index(parquet_dir: Path) -> Path:
+    """Constrói o índice de CNPJ de parquet_dir se ausente ou desatualizado."""
+    files = [f for _, group in _list_parquet_groups(parquet_dir) for f in group]
+    index_dir = cnpj_index_dir(parquet_dir)
+    if cnpj_index.is_current(index_dir, files, parquet_dir):
+        print(f"[SKIP] Índice de CNPJ já atualizado ({index_dir.name}).")
+    else:
+        cnpj_index.build_cnpj_index(files, index_dir, parquet_dir)
+    return index_dir
+
+
+def _lookup_cnpj_estab(
+    parquet_dir: Path,
+    cnpjs: pl.Series,
+    output_path: Path,
+) -> int | None:
     """
-    Lê a primeira coluna de um XLSX e retorna um conjunto de CNPJs
-    com 14 dígitos (somente algarismos).
+    Busca os CNPJs pelo índice e grava output_path. Retorna o número de
+    registros, ou None se o índice estiver ausente ou desatualizado.
     """
-    import openpyxl
-
-    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
-    ws = wb.active
-    cnpjs: set[str] = set()
+    files = [f for _, group in _list_parquet_groups(parquet_dir) for f in group]
+    index_dir = cnpj_index_dir(parquet_dir)
+    if not cnpj_index.is_current(index_dir, files, parquet_dir):
+        print("[WARN] Índice de CNPJ ausente ou desatualizado; varrendo os arquivos.")
+        return None
 
-    for row in ws.iter_rows(values_only=True):
-        if row[0] is None:
-            continue
-        digits = "".join(c for c in str(row[0]) if c.isdigit())
-        if len(digits) == 14:
-            cnpjs.add(digits)
+    with cnpj_index.CnpjIndex(index_dir, parquet_dir) as index:
+        found = index.lookup(cnpjs)
+        row_groups = index.row_groups
 
-    wb.close()
-    print(f"[CNPJ] {len(cnpjs):,} CNPJs válidos carregados de {path}")
-    return cnpjs
+    total = sum(len(rows) for rows in found.values())
+    print(f"[INDX] {total:,} CNPJs localizados em {len(found)} arquivo(s)")
+    with ParquetPartsWriter(output_path) as writer:
+        for i, (path, rows) in enumerate(sorted(found.items())):
+            writer.write(cnpj_index.read_rows(path, rows, row_groups[path]), i)
+    return writer.rows
 
 
 def filter_cnpj_estab(
     parquet_dir: Path,
-    cnpjs: set[str],
+    cnpjs: pl.Series,
     output_path: Path,
+    workers: int | None = None,
+    memory_mb: int = FILTER_MEMORY_MB,
+    use_index: bool = False,
 ) -> Path:
     """
-    Filtra Parquets de ESTABELE pelo CNPJ completo de 14 dígitos
-    (CNPJ_BASICO + CNPJ_ORDEM + CNPJ_DV).
-    Processa um arquivo por vez para controlar o uso de memória.
+    Filtra Parquets de ESTABELE pelo CNPJ completo de 14 dígitos, comparado
+    com a chave inteira CNPJ gravada na ingestão.
+    Escaneia vários arquivos em paralelo dentro de memory_mb (ver _scan_filter),
+    pulando os que o filtro de Bloom descarta (_prune_by_bloom).
+    Com use_index e até CNPJ_INDEX_MAX_KEYS CNPJs, usa o índice de CNPJ
+    (ensure_cnpj_index) e lê só as linhas encontradas.
 
     Args:
         parquet_dir: Diretório com os Parquets de ESTABELE
-        cnpjs:       Conjunto de CNPJs de 14 dígitos (somente algarismos)
+        cnpjs:       CNPJs como chaves Int64 (cnpj_input.load_cnpjs)
         output_path: Caminho do arquivo de saída
+        workers:     Máximo de arquivos escaneados em paralelo (padrão: CPUs)
+        memory_mb:   Orçamento de memória dos scans paralelos
+        use_index:   Busca pelo índice de CNPJ quando disponível
 
     Retorna: output_path
     """
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    files = _list_parquet_files(parquet_dir)
-    partes: list[pl.DataFrame] = []
-
-    for f in files:
-        print(f"[FILT] Escaneando {f.name}...")
-        df = (
-            pl.scan_parquet(str(f))
-            .with_columns(
-                (
-                    pl.col("CNPJ_BASICO").str.zfill(8)
-                    + pl.col("CNPJ_ORDEM").str.zfill(4)
-                    + pl.col("CNPJ_DV").str.zfill(2)
-                ).alias("_CNPJ_FULL")
-            )
-            .filter(pl.col("_CNPJ_FULL").is_in(cnpjs))
-            .drop("_CNPJ_FULL")
-            .collect()
-        )
-        if len(df) > 0:
-            partes.append(df)
-            print(f"[FILT] → {len(df):,} matches em {f.name}")
 
-    df_final = pl.concat(partes, how="diagonal") if partes else pl.DataFrame()
-    df_final.write_parquet(output_path, compression="snappy")
-    print(f"[SAVE] {output_path.name} — {len(df_final):,} registros")
+    n = None
+    if use_index and len(cnpjs) <= CNPJ_INDEX_MAX_KEYS:
+        n = _lookup_cnpj_estab(parquet_dir, cnpjs, output_path)
+    if n is None:
+        basicos = (cnpjs // 1_000_000).cast(pl.Int32).unique()
+        groups = _prune_by_bloom(_list_parquet_groups(parquet_dir), basicos)
+        n = _scan_filter(
+            groups, _match_keys("CNPJ", cnpjs), output_path, workers, memory_mb
+        )
+    print(f"[SAVE] {output_path.name} — {n:,} registros")
     return output_path
 
 
@@ -227,40 +462,32 @@ def filter_cnpj_estab(
 
 def filter_cnpj_empresa(
     parquet_dir: Path,
-    cnpjs: set[str],
+    cnpjs: pl.Series,
     output_path: Path,
+    workers: int | None = None,
+    memory_mb: int = FILTER_MEMORY_MB,
 ) -> Path:
     """
     Filtra Parquets de EMPRE pelo CNPJ_BASICO (8 primeiros dígitos do CNPJ).
-    Processa um arquivo por vez para controlar o uso de memória.
+    Escaneia vários arquivos em paralelo dentro de memory_mb (ver _scan_filter),
+    pulando os que o filtro de Bloom descarta (_prune_by_bloom).
 
     Args:
         parquet_dir: Diretório com os Parquets de EMPRE
-        cnpjs:       Conjunto de CNPJs de 14 dígitos (somente algarismos)
+        cnpjs:       CNPJs como chaves Int64 (cnpj_input.load_cnpjs)
         output_path: Caminho do arquivo de saída
+        workers:     Máximo de arquivos escaneados em paralelo (padrão: CPUs)
+        memory_mb:   Orçamento de memória dos scans paralelos
 
     Retorna: output_path
     """
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    # Garante zeros à esquerda em ambos os lados da comparação
-    basicos = {c[:8].zfill(8) for c in cnpjs}
-    files = _list_parquet_files(parquet_dir)
-    partes: list[pl.DataFrame] = []
-
-    for f in files:
-        print(f"[FILT] Escaneando {f.name}...")
-        df = (
-            pl.scan_parquet(str(f))
-            .with_columns(pl.col("CNPJ_BASICO").str.zfill(8).alias("_BASICO_NORM"))
-            .filter(pl.col("_BASICO_NORM").is_in(basicos))
-            .drop("_BASICO_NORM")
-            .collect()
-        )
-        if len(df) > 0:
-            partes.append(df)
-            print(f"[FILT] → {len(df):,} matches em {f.name}")
-
-    df_final = pl.concat(partes, how="diagonal") if partes else pl.DataFrame()
-    df_final.write_parquet(output_path, compression="snappy")
-    print(f"[SAVE] {output_path.name} — {len(df_final):,} registros")
+    # CNPJ_BASICO é Int32: os 8 primeiros dígitos da chave (CNPJ // 10^6)
+    basicos = (cnpjs // 1_000_000).cast(pl.Int32).unique()
+    groups = _prune_by_bloom(_list_parquet_groups(parquet_dir), basicos)
+
+    n = _scan_filter(
+        groups, _match_keys("CNPJ_BASICO", basicos), output_path, workers, memory_mb
+    )
+    print(f"[SAVE] {output_path.name} — {n:,} registros")
     return output_path
@@ -0,0 +1,139 @@
+# =============================================================================
+# manifest.py — Registro local do que já foi listado e convertido.
+#
+# Fica em {base_dir}/manifest.json e guarda:
+#   • listings: resultado dos PROPFIND (meses disponíveis e ZIPs de cada
+#               mês/tipo) com o horário da consulta, reutilizado enquanto
+#               estiver dentro do TTL — sem nenhuma chamada de rede;
+#   • parquets: para cada Parquet gerado, o ZIP de origem (size + ETag), a
+#               versão do schema, o layout ("flat", "sorted" ou "hive") e
+#               o tamanho/linhas do Parquet gravado — no layout hive, o
+#               tamanho de cada parte (UF=../MUNICIPIO=../part-*.parquet).
+#
+# Um Parquet só é reaproveitado se o ZIP de origem não mudou, foi gravado
+# com o config.SCHEMA_VERSION atual e ainda tem o tamanho registrado
+# (detecta Parquets truncados ou substituídos, o que o simples
+# parquet_path.exists() não detecta).
+# =============================================================================
+
+import json
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import polars as pl
+
+from config import SCHEMA_VERSION
+
+MANIFEST_NAME = "manifest.json"
+
+
+class Manifest:
+    """Manifesto JSON thread-safe (os workers de conversão gravam em paralelo)."""
+
+    def __init__(self, base_dir: Path, ttl_secs: float = 24 * 3600):
+        self.base_dir = base_dir
+        self.path = base_dir / MANIFEST_NAME
+        self.ttl_secs = ttl_secs
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            self._data = json.loads(self.path.read_text())
+        else:
+            self._data = {}
+        self._data.setdefault("listings", {})
+        self._data.setdefault("parquets", {})
+
+    def _save(self) -> None:
+        """Grava de forma atômica (arquivo temporário + rename)."""
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self._data, indent=1, ensure_ascii=False))
+        tmp.replace(self.path)
+
+    # -----------------------------------------------------------------------
+    # Listagens remotas
+    # -----------------------------------------------------------------------
+
+    def listing(self, key: str, fetch: Callable[[], list]) -> list:
+        """
+        Retorna a listagem registrada sob `key` se tiver menos de ttl_secs;
+        caso contrário chama fetch() (PROPFIND), registra e retorna.
+        """
+        with self._lock:
+            cached = self._data["listings"].get(key)
+        if cached and time.time() - cached["fetched_at"] < self.ttl_secs:
+            print(f"[CACHE] Listagem '{key}' reaproveitada do manifesto.")
+            return cached["items"]
+
+        items = fetch()
+        with self._lock:
+            self._data["listings"][key] = {"fetched_at": time.time(), "items": items}
+            self._save()
+        return items
+
+    # -----------------------------------------------------------------------
+    # Parquets gerados
+    # -----------------------------------------------------------------------
+
+    def _key(self, parquet_path: Path) -> str:
+        return parquet_path.resolve().relative_to(self.base_dir.resolve()).as_posix()
+
+    def is_current(self, parquet_path: Path, entry: dict, layout: str = "flat") -> bool:
+        """
+        True se parquet_path foi gerado a partir deste mesmo ZIP remoto
+        (size/ETag iguais aos de `entry`), com o schema atual, e continua
+        íntegro em disco. Um Parquet "sorted" também atende a um pedido
+        "flat"; qualquer outra troca de layout exige reconversão.
+        """
+        with self._lock:
+            rec = self._data["parquets"].get(self._key(parquet_path))
+        if rec is None:
+            return False
+
+        rec_layout = rec.get("layout", "flat")
+        if rec_layout != layout and (layout, rec_layout) != ("flat", "sorted"):
+            return False
+
+        if "parts" in rec:
+            sizes = {self.base_dir / key: size for key, size in rec["parts"].items()}
+        else:
+            sizes = {parquet_path: rec["parquet_size"]}
+        return (
+            rec["size"] == entry["size"]
+            and rec["etag"] == entry["etag"]
+            and rec.get("schema") == SCHEMA_VERSION
+            and all(p.exists() and p.stat().st_size == n for p, n in sizes.items())
+        )
+
+    def record(
+        self,
+        parquet_path: Path,
+        entry: dict,
+        layout: str = "flat",
+        parts: list[Path] | None = None,
+    ) -> None:
+        """
+        Registra o Parquet recém-gerado a partir do ZIP `entry`. No layout
+        hive, parquet_path é só a chave do registro e `parts` são os
+        arquivos efetivamente gravados.
+        """
+        files = parquet_path if parts is None else parts
+        rows = pl.scan_parquet(files).select(pl.len()).collect().item() if files else 0
+        rec = {
+            "source": entry["name"],
+            "size": entry["size"],
+            "etag": entry["etag"],
+            "schema": SCHEMA_VERSION,
+            "layout": layout,
+            "rows": rows,
+        }
+        if parts is None:
+            rec["parquet_size"] = parquet_path.stat().st_size
+        else:
+            rec["parts"] = {self._key(p): p.stat().st_size for p in parts}
+
+        with self._lock:
+            self._data["parquets"][self._key(parquet_path)] = rec
+            self._save()
@@ -0,0 +1,230 @@
+# =============================================================================
+# parquet_io.py — Ponto único de gravação de Parquet do pipeline.
+#
+# Todas as gravações (conversão na ingestão, filtros e outputs enriquecidos)
+# passam por write_parquet/sink_parquet, que aplicam o perfil configurado
+# (compressão, nível e linhas por row group). O perfil padrão vem de
+# config.PARQUET_PROFILE e pode ser trocado via configure_profile() — o
+# pipeline chama configure_profile() uma vez, a partir da linha de comando.
+#
+# row_group_sizes() lê do rodapé o layout real dos row groups de um Parquet
+# já gravado (usado pelo índice de CNPJ); footer_digest() identifica o
+# conteúdo de um Parquet pelo rodapé, sem ler os dados.
+# =============================================================================
+
+import hashlib
+import shutil
+import struct
+import threading
+from pathlib import Path
+
+import polars as pl
+
+from config import PARQUET_PROFILE, PARQUET_PROFILES, PARQUET_ROW_GROUP_SIZE
+
+_options: dict = {
+    **PARQUET_PROFILES[PARQUET_PROFILE],
+    "row_group_size": PARQUET_ROW_GROUP_SIZE,
+}
+
+
+def configure_profile(
+    profile: str = PARQUET_PROFILE,
+    compression_level: int | None = None,
+    row_group_size: int | None = None,
+) -> dict:
+    """
+    Define o perfil de gravação usado pelo processo inteiro.
+    compression_level e row_group_size, se informados, sobrescrevem o perfil.
+    Retorna as opções efetivas.
+    """
+    if profile not in PARQUET_PROFILES:
+        raise ValueError(f"Perfil Parquet deve ser um de: {list(PARQUET_PROFILES)}")
+
+    _options.clear()
+    _options.update(PARQUET_PROFILES[profile])
+    _options["row_group_size"] = row_group_size or PARQUET_ROW_GROUP_SIZE
+    if compression_level is not None:
+        _options["compression_level"] = compression_level
+    return dict(_options)
+
+
+def write_parquet(df: pl.DataFrame, path: Path, **overrides) -> None:
+    """Grava com o perfil atual; overrides (ex.: row_group_size) têm precedência."""
+    df.write_parquet(path, **{**_options, **overrides})
+
+
+def sink_parquet(lf: pl.LazyFrame, path: Path, **overrides) -> None:
+    """Versão streaming de write_parquet."""
+    lf.sink_parquet(path, **{**_options, **overrides})
+
+
+# ---------------------------------------------------------------------------
+# Layout dos row groups (rodapé do Parquet)
+# ---------------------------------------------------------------------------
+# O Polars não expõe o tamanho de cada row group; o rodapé (FileMetaData,
+# Thrift compact protocol) é lido direto, pulando tudo menos
+# row_groups (campo 4) → num_rows (campo 3) de cada RowGroup.
+
+_PARQUET_MAGIC = b"PAR1"
+
+
+def _varint(buf: bytes, pos: int) -> tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return n, pos
+        shift += 7
+
+
+def _zigzag(buf: bytes, pos: int) -> tuple[int, int]:
+    n, pos = _varint(buf, pos)
+    return (n >> 1) ^ -(n & 1), pos
+
+
+def _field(buf: bytes, pos: int, fid: int) -> tuple[int, int, int]:
+    """Cabeçalho de campo: (id, tipo, posição do valor); tipo 0 é o fim do struct."""
+    header = buf[pos]
+    pos += 1
+    if not header:
+        return fid, 0, pos
+    if header >> 4:
+        return fid + (header >> 4), header & 0x0F, pos
+    fid, pos = _zigzag(buf, pos)
+    return fid, header & 0x0F, pos
+
+
+def _list(buf: bytes, pos: int) -> tuple[int, int, int]:
+    """Cabeçalho de lista: (tamanho, tipo dos elementos, posição do primeiro)."""
+    size, elem = buf[pos] >> 4, buf[pos] & 0x0F
+    pos += 1
+    if size == 15:
+        size, pos = _varint(buf, pos)
+    return size, elem, pos
+
+
+def _skip(buf: bytes, pos: int, ttype: int) -> int:
+    """Pula um valor Thrift do tipo ttype; retorna a posição seguinte."""
+    if ttype in (1, 2):                 # bool de campo: o valor está no cabeçalho
+        return pos
+    if ttype == 3:                      # byte
+        return pos + 1
+    if ttype in (4, 5, 6):              # i16, i32, i64
+        return _varint(buf, pos)[1]
+    if ttype == 7:                      # double
+        return pos + 8
+    if ttype == 8:                      # binary
+        n, pos = _varint(buf, pos)
+        return pos + n
+    if ttype in (9, 10):                # list, set (bools ocupam um byte)
+        size, elem, pos = _list(buf, pos)
+        for _ in range(size):
+            pos = pos + 1 if elem in (1, 2) else _skip(buf, pos, elem)
+        return pos
+    if ttype == 11:                     # map
+        size, pos = _varint(buf, pos)
+        if size:
+            kv = buf[pos]
+            pos += 1
+            for _ in range(size):
+                pos = _skip(buf, _skip(buf, pos, kv >> 4), kv & 0x0F)
+        return pos
+    if ttype == 12:                     # struct
+        fid = 0
+        while True:
+            fid, ftype, pos = _field(buf, pos, fid)
+            if not ftype:
+                return pos
+            pos = _skip(buf, pos, ftype)
+    raise ValueError(f"Tipo Thrift desconhecido: {ttype}")
+
+
+def _read_footer(path: Path) -> bytes:
+    """FileMetaData serializado, lido do fim do arquivo."""
+    with open(path, "rb") as f:
+        f.seek(-8, 2)
+        length, magic = struct.unpack("<I4s", f.read(8))
+        if magic != _PARQUET_MAGIC:
+            raise ValueError(f"{path} não é um arquivo Parquet")
+        f.seek(-8 - length, 2)
+        return f.read(length)
+
+
+def footer_digest(path: Path) -> str:
+    """
+    SHA-256 do rodapé do Parquet. O rodapé traz os offsets, tamanhos e
+    estatísticas de cada row group, então muda junto com o conteúdo, e
+    não depende de mtime (sobrevive a cópias e downloads).
+    """
+    return hashlib.sha256(_read_footer(path)).hexdigest()
+
+
+def row_group_sizes(path: Path) -> list[int]:
+    """Número de linhas de cada row group do Parquet, na ordem do arquivo."""
+    buf = _read_footer(path)
+    sizes: list[int] = []
+    fid, pos = 0, 0
+    while True:
+        fid, ftype, pos = _field(buf, pos, fid)
+        if not ftype:
+            return sizes
+        if fid != 4 or ftype != 9:
+            pos = _skip(buf, pos, ftype)
+            continue
+        n_groups, _, pos = _list(buf, pos)
+        for _ in range(n_groups):
+            rg_fid, num_rows = 0, None
+            while True:
+                rg_fid, rg_type, pos = _field(buf, pos, rg_fid)
+                if not rg_type:
+                    break
+                if rg_fid == 3 and rg_type == 6:
+                    num_rows, pos = _zigzag(buf, pos)
+                else:
+                    pos = _skip(buf, pos, rg_type)
+            sizes.append(num_rows)
+
+
+class ParquetPartsWriter:
+    """
+    Monta um Parquet a partir de DataFrames produzidos aos poucos, possivelmente
+    por threads diferentes: cada write() vira uma parte temporária em disco e
+    close() consolida as partes em streaming no arquivo final, na ordem dos
+    índices. Usado como context manager; em caso de erro as partes são
+    descartadas e o arquivo final não é gravado.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.parts_dir = path.with_name(f"{path.name}.parts")
+        self.rows = 0
+        self._lock = threading.Lock()
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        self.parts_dir.mkdir(parents=True)
+
+    def write(self, df: pl.DataFrame, index: int) -> None:
+        write_parquet(df, self.parts_dir / f"{index:06d}.parquet")
+        with self._lock:
+            self.rows += len(df)
+
+    def close(self) -> None:
+        parts = sorted(self.parts_dir.glob("*.parquet"))
+        try:
+            if parts:
+                sink_parquet(pl.scan_parquet(parts), self.path)
+            else:
+                write_parquet(pl.DataFrame(), self.path)
+        finally:
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+    def __enter__(self) -> "ParquetPartsWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
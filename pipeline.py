@@ -8,18 +8,30 @@ from pathlib import Path
 
 import polars as pl
 
-from config import SIAFI_MAP_PATH
-from downloader import download_all, get_latest_month
-from enricher import enrich
+from config import (
+    COORDS_CACHE_MB,
+    FILTER_MEMORY_MB,
+    GEO_MAX_NUM_DELTA,
+    PARQUET_PROFILE,
+    PARQUET_PROFILES,
+    PARQUET_ROW_GROUP_SIZE,
+    SIAFI_MAP_PATH,
+)
+from cnpj_input import CNPJ_READERS, load_cnpjs
+from downloader import CONVERT_MODES, download_all, get_available_months
+from enricher import configure_coords_cache, enrich, preload_coords, without_coords
 from filterer import (
+    all_municipios,
+    ensure_cnpj_index,
     filter_by_municipio,
     filter_cnpj_empresa,
     filter_cnpj_estab,
     ibge_to_info,
-    load_cnpjs_from_xlsx,
     load_siafi_map,
     siafi_to_ibge,
 )
+from manifest import Manifest
+from parquet_io import configure_profile, write_parquet
 
 # UFs que não têm arquivo de coordenadas e devem ser ignoradas no enriquecimento
 _UFS_INVALIDAS = {"EX"}  # EX = exterior (código RFB para empresas estrangeiras)
@@ -45,20 +57,26 @@ def parse_args() -> argparse.Namespace:
         help="Outputs desejados (um ou mais).",
     )
     parser.add_argument(
-        "--municipios", nargs="+", type=int,
-        help="Códigos IBGE dos municípios (ex: 5002704 5002472). "
+        "--municipios", nargs="+",
+        help="Códigos IBGE dos municípios (ex: 5002704 5002472), ou 'all' "
+             "para todos os municípios da --uf (sem --uf, do país inteiro). "
              "Obrigatório para output 'municipio'.",
     )
     parser.add_argument(
         "--uf", type=str,
         help="UF para arquivo de coordenadas (ex: MS). "
-             "Obrigatório para output 'municipio'.",
+             "Obrigatório para output 'municipio', exceto com --municipios all.",
     )
     parser.add_argument(
         "--cnpjs-file", type=str,
-        help="Caminho do XLSX com coluna de CNPJs. "
+        help="Lista de CNPJs na primeira coluna (formato pela extensão: "
+             f"{', '.join(CNPJ_READERS)}). "
              "Obrigatório para outputs 'cnpj_estab' e 'cnpj_empresa'.",
     )
+    parser.add_argument(
+        "--no-cnpj-check", action="store_true",
+        help="Não descarta CNPJs da lista com dígito verificador inválido.",
+    )
     parser.add_argument(
         "--base-dir", required=True,
         help="Diretório base para armazenar todos os dados (ex: /tmp/rfb_data).",
@@ -70,12 +88,92 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "--max-parallel", type=int, default=2,
-        help="Máximo de downloads simultâneos (padrão: 2).",
+        help="Paralelismo padrão de download e de conversão (padrão: 2).",
+    )
+    parser.add_argument(
+        "--download-workers", type=int, default=None,
+        help="Downloads simultâneos (padrão: --max-parallel).",
+    )
+    parser.add_argument(
+        "--convert-workers", type=int, default=None,
+        help="Conversões ZIP → Parquet simultâneas (padrão: --max-parallel).",
+    )
+    parser.add_argument(
+        "--download-segments", type=int, default=1,
+        help="Conexões paralelas por arquivo, cada uma baixando um intervalo "
+             "de bytes (padrão: 1, download sequencial).",
+    )
+    parser.add_argument(
+        "--convert-mode", choices=CONVERT_MODES, default="stream",
+        help="Conversão ZIP → Parquet: 'stream' lê o CSV direto do ZIP, sem "
+             "arquivos intermediários; 'disk' grava um CSV utf8 temporário "
+             "(padrão: stream).",
+    )
+    parser.add_argument(
+        "--sort-on-ingest", action="store_true",
+        help="Ordena cada Parquet na ingestão (ESTABELE por UF/MUNICIPIO/"
+             "CNPJ_BASICO, EMPRE por CNPJ_BASICO) em row groups menores, "
+             "para que os filtros pulem row groups pelas estatísticas. "
+             "Aumenta a RAM usada por conversão.",
+    )
+    parser.add_argument(
+        "--partition-on-ingest", action="store_true",
+        help="Grava ESTABELE particionado em UF=../MUNICIPIO=../part-*.parquet; "
+             "o filtro por município passa a ler só os diretórios pedidos.",
+    )
+    parser.add_argument(
+        "--cnpj-index", action="store_true",
+        help="Constrói (uma vez por mês) um índice CNPJ → arquivo/linha de "
+             "ESTABELE e o usa em 'cnpj_estab' para ler só as linhas pedidas.",
+    )
+    parser.add_argument(
+        "--filter-workers", type=int, default=None,
+        help="Arquivos escaneados em paralelo na filtragem (padrão: número de CPUs).",
+    )
+    parser.add_argument(
+        "--filter-memory-mb", type=int, default=FILTER_MEMORY_MB,
+        help="Orçamento de memória dos scans paralelos da filtragem, em MB; "
+             f"limita --filter-workers (padrão: {FILTER_MEMORY_MB}).",
+    )
+    parser.add_argument(
+        "--coords-cache-mb", type=int, default=COORDS_CACHE_MB,
+        help="Memória máxima das coordenadas padronizadas mantidas em cache "
+             f"entre municípios e UFs, em MB (padrão: {COORDS_CACHE_MB}).",
+    )
+    parser.add_argument(
+        "--parquet-profile", choices=list(PARQUET_PROFILES), default=PARQUET_PROFILE,
+        help="Perfil de gravação de todos os Parquets: 'default' (snappy), "
+             "'archive' (zstd, menor) ou 'scratch' (lz4, mais rápido) "
+             f"(padrão: {PARQUET_PROFILE}).",
+    )
+    parser.add_argument(
+        "--compression-level", type=int, default=None,
+        help="Nível de compressão; sobrescreve o do perfil (zstd: 1-22).",
+    )
+    parser.add_argument(
+        "--row-group-size", type=int, default=PARQUET_ROW_GROUP_SIZE,
+        help="Linhas por row group nos Parquets; também limita a RAM de "
+             f"cada conversão (padrão: {PARQUET_ROW_GROUP_SIZE:,}).",
+    )
+    parser.add_argument(
+        "--listing-ttl-hours", type=float, default=24,
+        help="Validade das listagens remotas (PROPFIND) guardadas no manifesto "
+             "de --base-dir, em horas (padrão: 24).",
+    )
+    parser.add_argument(
+        "--refresh-listing", action="store_true",
+        help="Ignora as listagens do manifesto e consulta o servidor novamente.",
     )
     parser.add_argument(
         "--no-nominatim", action="store_true",
         help="Desabilita o fallback via Nominatim.",
     )
+    parser.add_argument(
+        "--geo-max-num-delta", type=int, default=GEO_MAX_NUM_DELTA,
+        help="Maior distância entre o número do estabelecimento e o do ponto "
+             "mais próximo no mesmo CEP aceita no merge aproximado; além disso "
+             "o registro fica sem coordenadas (padrão: sem limite).",
+    )
 
     args = parser.parse_args()
 
@@ -84,10 +182,17 @@ def parse_args() -> argparse.Namespace:
     if "municipio" in args.outputs and not args.municipios:
         parser.error("--municipios é obrigatório para o output 'municipio'.")
 
+    args.all_municipios = args.municipios == ["all"]
+    if args.municipios and not args.all_municipios:
+        try:
+            args.municipios = [int(m) for m in args.municipios]
+        except ValueError:
+            parser.error("--municipios aceita códigos IBGE numéricos ou 'all'.")
+
     if needs_cnpj and not args.cnpjs_file:
         parser.error("--cnpjs-file é obrigatório para outputs 'cnpj_estab' e 'cnpj_empresa'.")
 
-    if "municipio" in args.outputs and not args.uf:
+    if "municipio" in args.outputs and not args.uf and not args.all_municipios:
         parser.error("--uf é obrigatório para o output 'municipio'.")
 
     return args
@@ -104,21 +209,77 @@ def _enrich_and_save(
     coords_dir: Path,
     ibge_codes: list[int] | None,
     use_nominatim: bool,
+    max_num_delta: int | None = GEO_MAX_NUM_DELTA,
 ) -> None:
     """Lê um Parquet de estabelecimentos, enriquece e salva."""
     df = pl.read_parquet(raw_path)
-    df = enrich(df, uf, coords_dir, ibge_codes=ibge_codes, use_nominatim=use_nominatim)
+    df = enrich(
+        df, uf, coords_dir,
+        ibge_codes=ibge_codes,
+        use_nominatim=use_nominatim,
+        max_num_delta=max_num_delta,
+    )
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    df.write_parquet(out_path, compression="snappy")
+    write_parquet(df, out_path)
     print(f"[SAVE] {out_path.name}\n")
 
 
+def _enrich_municipios(
+    municipio_paths: dict[int, Path],
+    ibge_info: dict[int, dict],
+    uf: str | None,
+    coords_dir: Path,
+    out_dir: Path,
+    use_nominatim: bool,
+    max_num_delta: int | None = GEO_MAX_NUM_DELTA,
+) -> None:
+    """
+    Enriquece os Parquets por município, agrupados por UF: as coordenadas
+    dos municípios de cada UF são lidas numa só passada (preload_coords) e
+    depois recortadas do cache. Sem `uf`, usa a UF de cada município na
+    tabela SIAFI ↔ IBGE.
+    """
+    por_uf: dict[str, list[int]] = {}
+    for ibge in municipio_paths:
+        por_uf.setdefault(uf or ibge_info[ibge]["uf"], []).append(ibge)
+
+    for uf_mun, ibges in por_uf.items():
+        try:
+            preload_coords(uf_mun, coords_dir, ibges)
+            sem_coords = False
+        except FileNotFoundError:
+            print(f"[WARN] Sem arquivo de coords para UF={uf_mun}. Pulando enriquecimento.")
+            sem_coords = True
+
+        for ibge in ibges:
+            info = ibge_info[ibge]
+            nome_safe = info["nome"].replace(" ", "_").replace("/", "-")
+            out_path  = out_dir / f"ESTAB_{nome_safe}_{ibge}.parquet"
+            print(f"[ENRI] {info['nome']} ({ibge})...")
+
+            if sem_coords:
+                out_path.parent.mkdir(parents=True, exist_ok=True)
+                write_parquet(without_coords(pl.read_parquet(municipio_paths[ibge])), out_path)
+                print(f"[SAVE] {out_path.name}\n")
+                continue
+
+            _enrich_and_save(
+                municipio_paths[ibge], out_path,
+                uf=uf_mun,
+                coords_dir=coords_dir,
+                ibge_codes=[ibge],
+                use_nominatim=use_nominatim,
+                max_num_delta=max_num_delta,
+            )
+
+
 def _enrich_cnpj_estab(
     raw_path: Path,
     out_path: Path,
     coords_dir: Path,
     df_map: pl.DataFrame,
     use_nominatim: bool,
+    max_num_delta: int | None = GEO_MAX_NUM_DELTA,
 ) -> None:
     """
     Enriquece o resultado do filtro por CNPJ agrupando por UF presente nos dados.
@@ -136,7 +297,7 @@ def _enrich_cnpj_estab(
         # Ignora UFs que não têm arquivo de coordenadas
         if uf_upper in _UFS_INVALIDAS:
             print(f"[SKIP] UF={uf_upper} ignorada (sem arquivo de coordenadas esperado).")
-            partes.append(df.filter(pl.col("UF") == uf_val))
+            partes.append(without_coords(df.filter(pl.col("UF") == uf_val)))
             continue
 
         df_uf = df.filter(pl.col("UF") == uf_val)
@@ -148,15 +309,17 @@ def _enrich_cnpj_estab(
                 df_uf, uf_upper, coords_dir,
                 ibge_codes=ibge_codes or None,
                 use_nominatim=use_nominatim,
+                max_num_delta=max_num_delta,
             )
         except FileNotFoundError:
             print(f"[WARN] Sem arquivo de coords para UF={uf_upper}. Pulando enriquecimento.")
+            df_uf = without_coords(df_uf)
 
         partes.append(df_uf)
 
-    df_final = pl.concat(partes, how="diagonal") if partes else df
+    df_final = pl.concat(partes, how="vertical") if partes else without_coords(df)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    df_final.write_parquet(out_path, compression="snappy")
+    write_parquet(df_final, out_path)
     print(f"[SAVE] {out_path.name}\n")
 
 
@@ -170,17 +333,29 @@ def main() -> None:
     base_dir   = Path(args.base_dir)
     coords_dir = Path(args.coords_dir) if args.coords_dir else base_dir
     use_nominatim = not args.no_nominatim
+    parquet_opts = configure_profile(
+        args.parquet_profile, args.compression_level, args.row_group_size
+    )
+    configure_coords_cache(args.coords_cache_mb)
+    ttl_secs = 0 if args.refresh_listing else args.listing_ttl_hours * 3600
+    manifest = Manifest(base_dir, ttl_secs=ttl_secs)
 
     # Resolve mês
-    month = get_latest_month() if args.month == "latest" else args.month
+    if args.month == "latest":
+        month = manifest.listing("months", get_available_months)[-1]
+    else:
+        month = args.month
 
     print("\n" + "=" * 60)
     print(f"  Mês de referência : {month}")
     print(f"  Outputs           : {args.outputs}")
-    if args.municipios:
+    if args.all_municipios:
+        print(f"  Municípios (IBGE) : todos ({args.uf or 'Brasil'})")
+    elif args.municipios:
         print(f"  Municípios (IBGE) : {args.municipios}")
     if args.uf:
         print(f"  UF                : {args.uf}")
+    print(f"  Parquet           : {parquet_opts}")
     print("=" * 60 + "\n")
 
     parquet_dir = base_dir / month / "parquet"
@@ -195,13 +370,32 @@ def main() -> None:
     print("── ETAPA 1: Download ──────────────────────────────────────\n")
 
     if needs_estab:
-        estab_paths = download_all(month, "ESTABELE", parquet_dir / "ESTABELE", args.max_parallel)
+        estab_paths = download_all(
+            month, "ESTABELE", parquet_dir / "ESTABELE",
+            args.max_parallel, args.convert_mode,
+            download_workers=args.download_workers,
+            convert_workers=args.convert_workers,
+            download_segments=args.download_segments,
+            manifest=manifest,
+            sort_on_ingest=args.sort_on_ingest,
+            partition_on_ingest=args.partition_on_ingest,
+        )
         if not estab_paths:
             print("[ERROR] Nenhum arquivo ESTABELE foi baixado com sucesso. Abortando.")
             sys.exit(1)
+        if args.cnpj_index and "cnpj_estab" in args.outputs:
+            ensure_cnpj_index(parquet_dir / "ESTABELE")
 
     if needs_empresa:
-        empre_paths = download_all(month, "EMPRE", parquet_dir / "EMPRE", args.max_parallel)
+        empre_paths = download_all(
+            month, "EMPRE", parquet_dir / "EMPRE",
+            args.max_parallel, args.convert_mode,
+            download_workers=args.download_workers,
+            convert_workers=args.convert_workers,
+            download_segments=args.download_segments,
+            manifest=manifest,
+            sort_on_ingest=args.sort_on_ingest,
+        )
         if not empre_paths:
             print("[ERROR] Nenhum arquivo EMPRE foi baixado com sucesso. Abortando.")
             sys.exit(1)
@@ -211,29 +405,41 @@ def main() -> None:
     # -----------------------------------------------------------------------
     print("\n── ETAPA 2: Filtragem ─────────────────────────────────────\n")
 
-    cnpjs: set[str] | None = None
+    cnpjs: pl.Series | None = None
     if args.cnpjs_file:
-        cnpjs = load_cnpjs_from_xlsx(args.cnpjs_file)
+        cnpjs = load_cnpjs(args.cnpjs_file, validate=not args.no_cnpj_check)
 
     df_map = load_siafi_map()
 
     municipio_paths: dict[int, Path] = {}
     if "municipio" in args.outputs:
+        if args.all_municipios:
+            args.municipios = all_municipios(df_map, args.uf)
+            print(f"[INFO] {len(args.municipios):,} municípios selecionados.")
         ibge_info = ibge_to_info(args.municipios, df_map)
         municipio_paths = filter_by_municipio(
             parquet_dir / "ESTABELE",
             ibge_info,
             output_dir / "municipio" / "_raw",
+            workers=args.filter_workers,
+            memory_mb=args.filter_memory_mb,
         )
 
     cnpj_estab_raw: Path | None = None
     if "cnpj_estab" in args.outputs:
         cnpj_estab_raw = output_dir / "cnpj_estab" / "_raw" / "ESTAB_CNPJ.parquet"
-        filter_cnpj_estab(parquet_dir / "ESTABELE", cnpjs, cnpj_estab_raw)
+        filter_cnpj_estab(
+            parquet_dir / "ESTABELE", cnpjs, cnpj_estab_raw,
+            workers=args.filter_workers, memory_mb=args.filter_memory_mb,
+            use_index=args.cnpj_index,
+        )
 
     if "cnpj_empresa" in args.outputs:
         empresa_out = output_dir / "cnpj_empresa" / "EMPRESA_CNPJ.parquet"
-        filter_cnpj_empresa(parquet_dir / "EMPRE", cnpjs, empresa_out)
+        filter_cnpj_empresa(
+            parquet_dir / "EMPRE", cnpjs, empresa_out,
+            workers=args.filter_workers, memory_mb=args.filter_memory_mb,
+        )
 
     # -----------------------------------------------------------------------
     # ETAPA 3 — Enriquecimento com coordenadas
@@ -241,19 +447,14 @@ def main() -> None:
     print("\n── ETAPA 3: Enriquecimento ────────────────────────────────\n")
 
     if "municipio" in args.outputs:
-        ibge_info = ibge_to_info(args.municipios, df_map)
-        for ibge, raw_path in municipio_paths.items():
-            info = ibge_info[ibge]
-            nome_safe = info["nome"].replace(" ", "_").replace("/", "-")
-            out_path  = output_dir / "municipio" / f"ESTAB_{nome_safe}_{ibge}.parquet"
-            print(f"[ENRI] {info['nome']} ({ibge})...")
-            _enrich_and_save(
-                raw_path, out_path,
-                uf=args.uf,
-                coords_dir=coords_dir,
-                ibge_codes=[ibge],
-                use_nominatim=use_nominatim,
-            )
+        _enrich_municipios(
+            municipio_paths, ibge_info,
+            uf=args.uf,
+            coords_dir=coords_dir,
+            out_dir=output_dir / "municipio",
+            use_nominatim=use_nominatim,
+            max_num_delta=args.geo_max_num_delta,
+        )
 
     if "cnpj_estab" in args.outputs and cnpj_estab_raw:
         out_path = output_dir / "cnpj_estab" / "ESTAB_CNPJ.parquet"
@@ -263,6 +464,7 @@ def main() -> None:
             coords_dir=coords_dir,
             df_map=df_map,
             use_nominatim=use_nominatim,
+            max_num_delta=args.geo_max_num_delta,
         )
 
     print("=" * 60)
@@ -0,0 +1,23 @@
+# =============================================================================
+# tests/conftest.py — Módulos do pipeline ficam na raiz do repositório;
+#                     fixture do servidor HTTP com falhas (fault_server.py).
+# =============================================================================
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fault_server import FaultServer  # noqa: E402
+
+
+@pytest.fixture
+def fault_server():
+    """Servidor local com 1 MB aleatório (semente fixa) e ETag "v1"."""
+    server = FaultServer(random.Random(3).randbytes(1024 * 1024))
+    yield server
+    server.close()
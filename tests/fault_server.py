@@ -0,0 +1,80 @@
+# =============================================================================
+# tests/fault_server.py — Servidor HTTP local que imita os downloads do
+#                         WebDAV da RFB (Range, If-Range, ETag) e derruba
+#                         conexões no meio da transferência.
+#
+# server.drops recebe, para as próximas respostas, quantos bytes do corpo
+# enviar antes de fechar a conexão (o Content-Length anunciado continua o
+# completo, como numa queda real). server.requests guarda os cabeçalhos de
+# cada GET recebido.
+# =============================================================================
+
+import re
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        server: FaultServer = self.server.owner
+        payload, etag = server.payload, server.etag
+        with server.lock:
+            server.requests.append(dict(self.headers))
+            drop = server.drops.pop(0) if server.drops else None
+
+        status, start, end = 200, 0, len(payload) - 1
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if match and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            if start >= len(payload):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(payload)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        body = payload[start:end + 1]
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+        self.end_headers()
+
+        if drop is None:
+            self.wfile.write(body)
+            return
+        self.wfile.write(body[:drop])
+        self.wfile.flush()
+        self.close_connection = True
+        self.connection.shutdown(socket.SHUT_RDWR)
+
+
+class FaultServer:
+    """Serve `payload` em qualquer caminho, em 127.0.0.1 numa porta livre."""
+
+    def __init__(self, payload: bytes, etag: str = '"v1"'):
+        self.payload = payload
+        self.etag = etag
+        self.drops: list[int] = []
+        self.requests: list[dict] = []
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self.url = f"http://127.0.0.1:{self._httpd.server_port}/public.php/webdav/arquivo.zip"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
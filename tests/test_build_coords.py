@@ -0,0 +1,51 @@
+# =============================================================================
+# tests/test_build_coords.py — Store padronizado de coordenadas.
+# =============================================================================
+
+import polars as pl
+
+from build_coords import build_coords
+from enricher import coords_store_is_current, scan_coords
+
+
+def _write_coords(coords_dir, uf: str, lat: float | None) -> int:
+    path = coords_dir / f"coord_{uf}.parquet"
+    pl.DataFrame({
+        "COD_MUNICIPIO": [5002704, 5002704],
+        "CEP": ["79002000", "79002000"],
+        "NUM_ENDERECO": ["10", "20"],
+        "LATITUDE": [lat, -20.0],
+        "LONGITUDE": [-54.6, -54.6],
+    }).write_parquet(path, compression="uncompressed")
+    return path.stat().st_size
+
+
+def test_same_size_replacement_invalidates_store(tmp_path):
+    size = _write_coords(tmp_path, "MS", -20.5)
+    build_coords("MS", tmp_path)
+    assert coords_store_is_current("MS", tmp_path)
+
+    # Cópia idêntica (novo mtime, como num download) continua valendo
+    source = tmp_path / "coord_MS.parquet"
+    source.write_bytes(source.read_bytes())
+    assert coords_store_is_current("MS", tmp_path)
+
+    assert _write_coords(tmp_path, "MS", -21.5) == size
+    assert not coords_store_is_current("MS", tmp_path)
+    lats = scan_coords("MS", tmp_path).collect()["LATITUDE"].sort().to_list()
+    assert lats[0] == pl.Series([-21.5], dtype=pl.Float32)[0]
+
+
+def test_uf_without_valid_points_builds_empty_store(tmp_path):
+    pl.DataFrame({
+        "COD_MUNICIPIO": [1200401],
+        "CEP": ["69900000"],
+        "NUM_ENDERECO": ["1"],
+        "LATITUDE": [None],
+        "LONGITUDE": [-67.8],
+    }, schema_overrides={"LATITUDE": pl.Float64}).write_parquet(tmp_path / "coord_AC.parquet")
+
+    build_coords("AC", tmp_path)
+
+    assert coords_store_is_current("AC", tmp_path)
+    assert scan_coords("AC", tmp_path).collect().is_empty()
@@ -0,0 +1,51 @@
+# =============================================================================
+# tests/test_cnpj_index.py — Índice de CNPJ e leitura por row group.
+# =============================================================================
+
+import polars as pl
+import pytest
+
+import cnpj_index
+from parquet_io import row_group_sizes
+
+
+@pytest.mark.parametrize("row_group_size", [1, 7, 300, 1000])
+def test_row_group_sizes_reads_footer(tmp_path, row_group_size):
+    path = tmp_path / "f.parquet"
+    pl.select(
+        pl.int_range(1000).alias("A"),
+        pl.format("X{}", pl.int_range(1000)).alias("B"),
+        (pl.int_range(1000) % 2 == 0).alias("C"),
+    ).write_parquet(path, row_group_size=row_group_size)
+
+    sizes = row_group_sizes(path)
+    assert sum(sizes) == 1000
+    assert sizes[0] == min(row_group_size, 1000)
+
+
+def test_lookup_reads_rows_across_row_group_layouts(tmp_path):
+    # Dois arquivos gravados com row groups diferentes, chaves embaralhadas
+    files = []
+    for i, row_group_size in enumerate([50, 333]):
+        path = tmp_path / f"ESTABELE{i}.parquet"
+        pl.select(
+            (pl.int_range(1000, dtype=pl.Int64) * 10 + i).shuffle(seed=i).alias("CNPJ"),
+            pl.lit(f"arquivo {i}").alias("ORIGEM"),
+        ).write_parquet(path, row_group_size=row_group_size)
+        files.append(path)
+    index_dir = tmp_path / "ESTABELE.cnpjidx"
+
+    assert cnpj_index.build_cnpj_index(files, index_dir, tmp_path) == 2000
+    assert cnpj_index.is_current(index_dir, files, tmp_path)
+
+    wanted = pl.Series("CNPJ", [0, 11, 4990, 9991, 5000, 123_456_789], dtype=pl.Int64)
+    with cnpj_index.CnpjIndex(index_dir, tmp_path) as index:
+        found = index.lookup(wanted)
+        assert index.row_groups[files[1]] == row_group_sizes(files[1])
+        df = pl.concat(
+            cnpj_index.read_rows(path, rows, index.row_groups[path])
+            for path, rows in sorted(found.items())
+        )
+
+    assert sorted(df["CNPJ"].to_list()) == [0, 11, 4990, 5000, 9991]
+    assert df.filter(pl.col("CNPJ") % 10 == 1)["ORIGEM"].unique().to_list() == ["arquivo 1"]
@@ -0,0 +1,132 @@
+# =============================================================================
+# tests/test_downloader_resume.py — Download retomável (Range/If-Range,
+# checkpoint {zip}.part.json) e segmentado contra um servidor local que
+# derruba conexões (fault_server.py).
+# =============================================================================
+
+import json
+
+import pytest
+
+import downloader
+
+
+@pytest.fixture(autouse=True)
+def _fast_retries(monkeypatch):
+    """Sem espera entre tentativas; blocos e segmentos pequenos."""
+    monkeypatch.setattr(downloader, "_backoff_secs", lambda attempt: 0)
+    monkeypatch.setattr(downloader, "_DOWNLOAD_CHUNK_BYTES", 64 * 1024)
+    monkeypatch.setattr(downloader, "_MIN_SEGMENT_BYTES", 1)
+
+
+def _write_part(zip_path, data: bytes, meta: dict) -> None:
+    part = zip_path.with_name(zip_path.name + ".part")
+    part.write_bytes(data)
+    part.with_name(part.name + ".json").write_text(json.dumps(meta))
+
+
+def test_resumes_with_range_after_dropped_connection(tmp_path, fault_server):
+    fault_server.drops = [300_000, 500_000]
+    zip_path = tmp_path / "arquivo.zip"
+    size = len(fault_server.payload)
+
+    downloader._download_with_retry("arquivo.zip", fault_server.url, zip_path, size, '"v1"')
+
+    assert zip_path.read_bytes() == fault_server.payload
+    assert not zip_path.with_name("arquivo.zip.part").exists()
+    assert not zip_path.with_name("arquivo.zip.part.json").exists()
+
+    primeiro, *retomadas = fault_server.requests
+    assert "Range" not in primeiro
+    assert len(retomadas) == 2
+    offsets = [int(r["Range"].removeprefix("bytes=").rstrip("-")) for r in retomadas]
+    assert 0 < offsets[0] <= 300_000 < offsets[1]
+    assert all(r["If-Range"] == '"v1"' for r in retomadas)
+
+
+def test_if_range_mismatch_restarts_from_zero(tmp_path, fault_server):
+    # Parcial e checkpoint de uma versão anterior de mesmo tamanho e ETag
+    # anunciados, mas o servidor já tem outra versão: responde 200 inteiro
+    zip_path = tmp_path / "arquivo.zip"
+    size = len(fault_server.payload)
+    _write_part(zip_path, b"\0" * 200_000, {"size": size, "etag": '"v0"'})
+    fault_server.etag = '"v2"'
+
+    downloader._download_with_retry("arquivo.zip", fault_server.url, zip_path, size, '"v0"')
+
+    assert zip_path.read_bytes() == fault_server.payload
+    assert fault_server.requests[0]["Range"] == "bytes=200000-"
+    assert fault_server.requests[0]["If-Range"] == '"v0"'
+
+
+def test_stale_checkpoint_is_discarded(tmp_path, fault_server):
+    # O PROPFIND anuncia outro ETag: o parcial não é reaproveitado
+    zip_path = tmp_path / "arquivo.zip"
+    size = len(fault_server.payload)
+    _write_part(zip_path, b"\0" * 200_000, {"size": size, "etag": '"v0"'})
+
+    downloader._download_with_retry("arquivo.zip", fault_server.url, zip_path, size, '"v1"')
+
+    assert zip_path.read_bytes() == fault_server.payload
+    assert len(fault_server.requests) == 1
+    assert "Range" not in fault_server.requests[0]
+
+
+def test_short_file_fails_size_check(tmp_path, fault_server, monkeypatch):
+    monkeypatch.setattr(downloader, "_DOWNLOAD_RETRIES", 2)
+    zip_path = tmp_path / "arquivo.zip"
+    size = len(fault_server.payload) + 10  # PROPFIND anuncia mais do que vem
+
+    with pytest.raises(OSError):
+        downloader._download_with_retry("arquivo.zip", fault_server.url, zip_path, size, '"v1"')
+
+    assert not zip_path.exists()
+
+
+def test_segmented_download_resumes_each_segment(tmp_path, fault_server):
+    fault_server.drops = [100_000, 100_000, 100_000]
+    zip_path = tmp_path / "arquivo.zip"
+    size = len(fault_server.payload)
+
+    downloader._download_with_retry(
+        "arquivo.zip", fault_server.url, zip_path, size, '"v1"', segments=3
+    )
+
+    assert zip_path.read_bytes() == fault_server.payload
+    ranges = [r["Range"] for r in fault_server.requests]
+    assert len(ranges) == 6
+    # Cada segmento pede um intervalo fechado; as retomadas começam depois
+    # do início original do segmento, no mesmo fim
+    inicios = {r.split("-")[1]: [] for r in ranges}
+    for r in ranges:
+        a, b = r.removeprefix("bytes=").split("-")
+        inicios[b].append(int(a))
+    assert len(inicios) == 3
+    assert all(len(v) == 2 and v[0] < v[1] for v in inicios.values())
+
+
+def test_segmented_checkpoint_resumes_next_run(tmp_path, fault_server, monkeypatch):
+    # Primeira execução desiste com os segmentos pela metade
+    monkeypatch.setattr(downloader, "_DOWNLOAD_RETRIES", 1)
+    fault_server.drops = [150_000] * 3 + [0] * 3
+    zip_path = tmp_path / "arquivo.zip"
+    size = len(fault_server.payload)
+    with pytest.raises(OSError):
+        downloader._download_with_retry(
+            "arquivo.zip", fault_server.url, zip_path, size, '"v1"', segments=3
+        )
+    meta = json.loads(zip_path.with_name("arquivo.zip.part.json").read_text())
+    fins = [seg[1] for seg in meta["segments"]]
+    salvos = sorted(seg[0] for seg in meta["segments"])
+    assert all(pos > inicio for pos, inicio in zip(salvos, [0] + [f + 1 for f in fins[:-1]]))
+
+    # Segunda execução continua de cada posição salva
+    fault_server.drops = []
+    fault_server.requests.clear()
+    downloader._download_with_retry(
+        "arquivo.zip", fault_server.url, zip_path, size, '"v1"', segments=3
+    )
+
+    assert zip_path.read_bytes() == fault_server.payload
+    pedidos = sorted(int(r["Range"].removeprefix("bytes=").split("-")[0]) for r in fault_server.requests)
+    assert pedidos == salvos
@@ -0,0 +1,87 @@
+# =============================================================================
+# tests/test_enrich_schema.py — Outputs enriquecidos e não enriquecidos
+# (UF sem coord_{UF}.parquet, exterior) têm o mesmo schema.
+# =============================================================================
+
+from pathlib import Path
+
+import polars as pl
+
+from config import SCHEMA_ESTABELECIMENTO
+from pipeline import _enrich_cnpj_estab, _enrich_municipios
+
+
+def _estab(rows: list[dict]) -> pl.DataFrame:
+    """Estabelecimentos no schema da ingestão (colunas ausentes ficam nulas)."""
+    return pl.DataFrame(
+        [{name: row.get(name) for name in SCHEMA_ESTABELECIMENTO} for row in rows],
+        schema=SCHEMA_ESTABELECIMENTO,
+    )
+
+
+_ROWS = [
+    # Campo Grande/MS (SIAFI 9051, IBGE 5002704): casa com coord_MS
+    {"CNPJ": 12345678000195, "CNPJ_BASICO": 12345678, "UF": "MS", "MUNICIPIO": 9051,
+     "CEP": "79002-000", "NUMERO": "100"},
+    # São Paulo/SP (SIAFI 7107, IBGE 3550308): sem coord_SP
+    {"CNPJ": 1234567000100, "CNPJ_BASICO": 1234567, "UF": "SP", "MUNICIPIO": 7107,
+     "CEP": "01001000", "NUMERO": "10"},
+    # Exterior
+    {"CNPJ": 98765432000110, "CNPJ_BASICO": 98765432, "UF": "EX", "MUNICIPIO": 9707,
+     "CEP": None, "NUMERO": None},
+]
+
+_DF_MAP = pl.DataFrame({
+    "SIAFI": [9051, 7107],
+    "IBGE": [5002704, 3550308],
+    "MUNICIPIO_NOME": ["CAMPO GRANDE", "SAO PAULO"],
+    "UF": ["MS", "SP"],
+})
+
+
+def _write_coords(coords_dir: Path) -> None:
+    coords_dir.mkdir()
+    pl.DataFrame({
+        "COD_MUNICIPIO": [5002704],
+        "CEP": ["79002000"],
+        "NUM_ENDERECO": ["100"],
+        "LATITUDE": [-20.46],
+        "LONGITUDE": [-54.62],
+    }).write_parquet(coords_dir / "coord_MS.parquet")
+
+
+def test_cnpj_estab_mixes_enriched_and_skipped_ufs(tmp_path):
+    coords_dir = tmp_path / "coords"
+    _write_coords(coords_dir)
+    raw = tmp_path / "raw.parquet"
+    _estab(_ROWS).write_parquet(raw)
+    out = tmp_path / "ESTAB_CNPJ.parquet"
+
+    _enrich_cnpj_estab(raw, out, coords_dir, _DF_MAP, use_nominatim=False)
+
+    df = pl.read_parquet(out).sort("CNPJ")
+    assert df.schema["CNPJ"] == pl.Utf8
+    assert df["CNPJ"].to_list() == ["01234567000100", "12345678000195", "98765432000110"]
+    assert df["GEO_METHOD"].cast(pl.Utf8).to_list() == [None, "EXATO", None]
+    assert df["LATITUDE"].is_not_null().to_list() == [False, True, False]
+
+
+def test_municipios_without_coords_match_enriched_schema(tmp_path):
+    coords_dir = tmp_path / "coords"
+    _write_coords(coords_dir)
+    paths = {}
+    for ibge, row in [(5002704, _ROWS[0]), (3550308, _ROWS[1])]:
+        paths[ibge] = tmp_path / f"raw_{ibge}.parquet"
+        _estab([row]).write_parquet(paths[ibge])
+    info = {
+        5002704: {"siafi": 9051, "nome": "CAMPO GRANDE", "uf": "MS"},
+        3550308: {"siafi": 7107, "nome": "SAO PAULO", "uf": "SP"},
+    }
+    out_dir = tmp_path / "municipio"
+
+    _enrich_municipios(paths, info, None, coords_dir, out_dir, use_nominatim=False)
+
+    enriched = pl.read_parquet(out_dir / "ESTAB_CAMPO_GRANDE_5002704.parquet")
+    skipped = pl.read_parquet(out_dir / "ESTAB_SAO_PAULO_3550308.parquet")
+    assert skipped.schema == enriched.schema
+    assert skipped["CNPJ"].to_list() == ["01234567000100"]